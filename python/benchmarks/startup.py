@@ -0,0 +1,111 @@
+"""
+Startup benchmark for short-lived invocations (git pager, pre-commit hook)
+
+    python benchmarks/startup.py [--budget-ms N]
+
+Reports `-X importtime` of `import hlkit.parse`, checks that heavy
+modules are not imported by it, and times a cold first-file highlight
+(interpreter start, import, grammar load and parse of a small file) in a
+fresh process. Exits with status 1 when the budget is exceeded.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ASSETS_DIR = os.path.join(PYTHON_DIR, "..", "assets")
+SYNTAX_FILE = os.path.join(ASSETS_DIR, "Packages/JSON/JSON.sublime-syntax")
+
+# documented in README.md, measured on CPython 3.11 with libyaml
+COLD_START_BUDGET_MS = 100
+
+# must only be imported on first use
+LAZY_MODULES = [
+    "yaml",
+    "typing",
+    "hashlib",
+    "json",
+    "sqlite3",
+    "cffi",
+    "hlkit._onig",
+]
+
+HIGHLIGHT_SCRIPT = """
+import sys
+from hlkit.parse import ParseState
+from hlkit.syntax import SyntaxDefinition
+
+syndef = SyntaxDefinition.load_file(sys.argv[1])
+state = ParseState(syndef)
+for line in ['{"name": "hlkit", "tags": [1, 2.5, true, null]}\\n'] * 20:
+    state.parse_line(line)
+"""
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=PYTHON_DIR)
+    return subprocess.run(
+        [sys.executable, *args],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+def import_times(module: str):
+    """ `(cumulative us, module)` of every import done by `module` """
+    result = run_python("-X", "importtime", "-c", "import %s" % module)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times.append((int(cumulative), name.strip()))
+    return times
+
+
+def cold_start_ms(runs: int) -> float:
+    """ best wall time of a first-file highlight in a fresh process """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_python("-c", HIGHLIGHT_SCRIPT, SYNTAX_FILE)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--budget-ms", type=float, default=COLD_START_BUDGET_MS
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    times = import_times("hlkit.parse")
+    total = dict((name, us) for us, name in times)["hlkit.parse"]
+    print("import hlkit.parse: %.1f ms" % (total / 1000))
+    for us, name in sorted(times, reverse=True)[1:8]:
+        print("  %8.1f ms  %s" % (us / 1000, name))
+
+    imported = set(name for _, name in times)
+    eager = [name for name in LAZY_MODULES if name in imported]
+    if eager:
+        print("imported eagerly: %s" % ", ".join(eager))
+
+    elapsed = cold_start_ms(args.runs)
+    print("cold first-file highlight: %.1f ms" % elapsed)
+    print("budget: %d ms" % args.budget_ms)
+
+    if eager or elapsed > args.budget_ms:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+"""
+`typing.TYPE_CHECKING` without importing `typing`, which takes a few ms
+
+Modules import `typing` names under `if TYPE_CHECKING:` and write the
+annotations using them as strings, type checkers recognize the name.
+"""
+TYPE_CHECKING = False
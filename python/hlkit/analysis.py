@@ -0,0 +1,383 @@
+"""
+Static cost analysis of syntax definitions
+
+    python -m hlkit.analysis path/to/X.sublime-syntax [--corpus FILE]
+
+Reports the flattened pattern count of every context and flags patterns
+which are likely to be slow, optionally timing each regex against a
+sample corpus, so grammars can be fixed before they ship.
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+from hlkit._typing import TYPE_CHECKING
+from hlkit.prefilter import analyze
+from hlkit.syntax import MatchPattern, SyntaxContext, SyntaxDefinition
+
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional, Tuple
+
+FLAG_INVALID = "invalid"
+FLAG_NESTED_QUANTIFIER = "nested-quantifier"
+FLAG_AMBIGUOUS_ALTERNATION = "ambiguous-alternation"
+FLAG_NO_LITERAL_PREFIX = "no-literal-prefix"
+FLAG_UNANCHORED = "unanchored"
+
+# contribution of each flag to `PatternReport.score`
+FLAG_WEIGHTS = {
+    FLAG_INVALID: 100,
+    FLAG_NESTED_QUANTIFIER: 20,
+    FLAG_AMBIGUOUS_ALTERNATION: 10,
+    FLAG_NO_LITERAL_PREFIX: 3,
+    FLAG_UNANCHORED: 1,
+}
+
+# anchors making a regex match only at known positions
+ANCHORS = ("^", "\\A", "\\G")
+
+# `{n}`, `{n,}` or `{n,m}` quantifier
+BRACES_RE = re.compile(r"\{\d*(,\d*)?\}")
+
+
+class PatternReport(object):
+    pattern: MatchPattern
+    # label of the context defining the pattern, see `context_labels`
+    context: str
+    regex: str
+    flags: "List[str]"
+
+    # number of contexts whose flattened list contains the pattern
+    used_by: int
+
+    # total seconds of searches against the corpus, if benchmarked
+    seconds: "Optional[float]"
+
+    def __init__(self, pattern, context: str):
+        self.pattern = pattern
+        self.context = context
+        self.regex = str(pattern.match)
+        self.flags = regex_flags(self.regex)
+        self.used_by = 0
+        self.seconds = None
+
+    @property
+    def score(self) -> int:
+        weight = sum(FLAG_WEIGHTS[flag] for flag in self.flags)
+        return weight * max(self.used_by, 1)
+
+
+class ContextReport(object):
+    context: SyntaxContext
+    label: str
+
+    # flattened `MatchPattern` count, prototype and includes included
+    flattened_count: int
+
+    def __init__(self, context: SyntaxContext, label: str):
+        self.context = context
+        self.label = label
+        self.flattened_count = len(context.matches)
+
+
+class SyntaxReport(object):
+    syndef: SyntaxDefinition
+    contexts: "List[ContextReport]"
+    patterns: "List[PatternReport]"
+
+    def __init__(self, syndef: SyntaxDefinition):
+        self.syndef = syndef
+        self.contexts = []
+        self.patterns = []
+
+    def ranked_contexts(self) -> "List[ContextReport]":
+        return sorted(self.contexts, key=lambda c: -c.flattened_count)
+
+    def ranked_patterns(self) -> "List[PatternReport]":
+        """ slowest first: by benchmark time if any, then by score """
+
+        def sort_key(p: PatternReport):
+            return (-(p.seconds or 0.0), -p.score)
+
+        return sorted(self.patterns, key=sort_key)
+
+    def format(self, top: "Optional[int]" = None) -> str:
+        lines = [
+            "%s (%s): %d contexts, %d patterns"
+            % (
+                self.syndef.name,
+                self.syndef.scope,
+                len(self.contexts),
+                len(self.patterns),
+            ),
+            "",
+            "contexts by flattened pattern count:",
+        ]
+        for ctx_report in self.ranked_contexts()[:top]:
+            count = ctx_report.flattened_count
+            lines.append("%6d  %s" % (count, ctx_report.label))
+
+        lines.extend(["", "patterns by cost:"])
+        header = ("score", "time(ms)", "context", "flags")
+        lines.append("%6s %10s  %-24s %s" % header)
+        for p in self.ranked_patterns()[:top]:
+            seconds = "-" if p.seconds is None else "%.3f" % (p.seconds * 1000)
+            flags = ",".join(p.flags)
+            lines.append(
+                "%6d %10s  %-24s %s" % (p.score, seconds, p.context, flags)
+            )
+            lines.append("        %s" % _shorten(p.regex))
+
+        return "\n".join(lines)
+
+
+def context_labels(
+    syndef: SyntaxDefinition,
+) -> "List[Tuple[SyntaxContext, str]]":
+    """
+    all contexts with a readable label, nested contexts are labelled by
+    their position, e.g. `array[0]` is pushed by pattern 0 of `array`
+    """
+    result = []
+
+    def walk(ctx, label):
+        result.append((ctx, label))
+        for index, pattern in enumerate(ctx.patterns):
+            synctx = getattr(getattr(pattern, "action", None), "_synctx", None)
+            if synctx is not None:
+                walk(synctx, "%s[%d]" % (label, index))
+
+    for ctx in syndef.contexts:
+        walk(ctx, ctx.name)
+    return result
+
+
+def analyze_syntax(
+    syndef: SyntaxDefinition,
+    corpus: "Optional[List[str]]" = None,
+    *,
+    repeat: int = 3,
+) -> SyntaxReport:
+    """
+    :param corpus: sample lines, every regex is timed against them
+    :param repeat: number of passes over `corpus`
+    """
+    report = SyntaxReport(syndef)
+    by_pattern: "Dict[int, PatternReport]" = dict()
+
+    for ctx, label in context_labels(syndef):
+        report.contexts.append(ContextReport(ctx, label))
+        for pattern in ctx.patterns:
+            if isinstance(pattern, MatchPattern):
+                pattern_report = PatternReport(pattern, label)
+                by_pattern[id(pattern.match)] = pattern_report
+                report.patterns.append(pattern_report)
+
+    for ctx_report in report.contexts:
+        for pattern in ctx_report.context.matches:
+            # `matches` holds proxies, key by the (unique) regex object,
+            # patterns included from other syntaxes are not reported
+            pattern_report = by_pattern.get(id(pattern.match))
+            if pattern_report is not None:
+                pattern_report.used_by += 1
+
+    if corpus is not None:
+        for pattern_report in report.patterns:
+            seconds = benchmark(pattern_report.regex, corpus, repeat)
+            pattern_report.seconds = seconds
+
+    return report
+
+
+def benchmark(
+    regex: str, corpus: "List[str]", repeat: int = 3
+) -> "Optional[float]":
+    """ seconds spent searching `regex` in every line of `corpus` """
+    try:
+        compiled = re.compile(regex)
+    except re.error:
+        return None
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in corpus:
+            compiled.search(line)
+    return time.perf_counter() - start
+
+
+def regex_flags(regex: str) -> "List[str]":
+    """ flags for constructs of `regex` known to be slow """
+    flags = []
+
+    try:
+        re.compile(regex)
+    except re.error:
+        flags.append(FLAG_INVALID)
+
+    groups, quantifiers = _scan(regex)
+    for start, end, unbounded in groups:
+        if not unbounded:
+            continue
+        if any(start < pos < end for pos in quantifiers):
+            if FLAG_NESTED_QUANTIFIER not in flags:
+                flags.append(FLAG_NESTED_QUANTIFIER)
+        if _is_ambiguous(regex[start + 1 : end]):
+            if FLAG_AMBIGUOUS_ALTERNATION not in flags:
+                flags.append(FLAG_AMBIGUOUS_ALTERNATION)
+
+    if analyze(regex) is None:
+        flags.append(FLAG_NO_LITERAL_PREFIX)
+    if not regex.startswith(ANCHORS):
+        flags.append(FLAG_UNANCHORED)
+
+    return flags
+
+
+def _scan(regex: str) -> "Tuple[List[Tuple[int, int, bool]], List[int]]":
+    """
+    groups as `(start, end, unbounded)` and positions of unbounded
+    quantifiers (`*`, `+`, `{n,}`)
+    """
+    groups = []
+    quantifiers = []
+    opened: "List[int]" = []
+    in_class = False
+    # was the previous token a quantifier, `*+` after one is possessive
+    after_quantifier = False
+    i = 0
+
+    while i < len(regex):
+        c = regex[i]
+        if c == "\\":
+            i += 2
+            after_quantifier = False
+            continue
+
+        is_quantifier = False
+        if in_class:
+            if c == "]":
+                in_class = False
+        elif c == "[":
+            in_class = True
+            # leading `]` is a literal
+            if regex.startswith("[]", i):
+                i += 1
+            elif regex.startswith("[^]", i):
+                i += 2
+        elif c == "(":
+            opened.append(i)
+        elif c == ")" and opened:
+            groups.append((opened.pop(), i, _is_unbounded(regex, i + 1)))
+        elif c in "*+?" or BRACES_RE.match(regex, i):
+            is_quantifier = True
+            if not after_quantifier and _is_unbounded(regex, i):
+                quantifiers.append(i)
+            if c == "{":
+                i = BRACES_RE.match(regex, i).end() - 1
+        after_quantifier = is_quantifier
+        i += 1
+
+    return groups, quantifiers
+
+
+def _is_unbounded(regex: str, pos: int) -> bool:
+    """ is there a `*`, `+` or `{n,}` quantifier at `pos` """
+    if pos >= len(regex):
+        return False
+    if regex[pos] in "*+":
+        return True
+    return re.match(r"\{\d*,\}", regex[pos:]) is not None
+
+
+def _is_ambiguous(group: str) -> bool:
+    """ can alternatives of a repeated group start with the same char """
+    group = re.sub(r"^\?(:|<?[=!]|P?<\w+>)", "", group)
+    alternatives = _split_top_level(group)
+    if len(alternatives) < 2:
+        return False
+
+    seen = set()
+    for alternative in alternatives:
+        prefilter = analyze(alternative)
+        if prefilter is None:
+            return True
+        if seen & prefilter.first_chars:
+            return True
+        seen |= prefilter.first_chars
+    return False
+
+
+def _split_top_level(regex: str) -> "List[str]":
+    alternatives = []
+    depth = 0
+    in_class = False
+    last = 0
+    i = 0
+
+    while i < len(regex):
+        c = regex[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            alternatives.append(regex[last:i])
+            last = i + 1
+        i += 1
+
+    alternatives.append(regex[last:])
+    return alternatives
+
+
+def _shorten(regex: str, width: int = 72) -> str:
+    regex = " ".join(regex.split())
+    if len(regex) <= width:
+        return regex
+    return regex[: width - 3] + "..."
+
+
+def main(argv: "Optional[List[str]]" = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m hlkit.analysis",
+        description="Report slow patterns of a sublime syntax definition",
+    )
+    parser.add_argument("syntax", help="`.sublime-syntax` file")
+    parser.add_argument(
+        "--corpus", help="sample file to time every regex with"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--top", type=int, help="only show the N worst entries"
+    )
+    parser.add_argument(
+        "--fail-score",
+        type=int,
+        help="exit with status 1 if any pattern scores at least this",
+    )
+    args = parser.parse_args(argv)
+
+    syndef = SyntaxDefinition.load_file(args.syntax)
+    corpus = None
+    if args.corpus is not None:
+        corpus = Path(args.corpus).read_text().splitlines(True)
+
+    report = analyze_syntax(syndef, corpus, repeat=args.repeat)
+    print(report.format(top=args.top))
+
+    if args.fail_score is not None:
+        if any(p.score >= args.fail_score for p in report.patterns):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
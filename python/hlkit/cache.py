@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+from hlkit._typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Hashable, Optional
+
+
+class LineCache(object):
+    """
+    Bounded LRU memo of parsed lines
+      used by `ParseState.parse_line`
+
+    A cache must only be shared between `ParseState`s of the same
+    `SyntaxDefinition`, keys are made of its context ids.
+    """
+
+    maxsize: int
+
+    hits: int
+    misses: int
+
+    _entries: "OrderedDict[Hashable, Any]"
+
+    def __init__(self, maxsize: int = 1024):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def get(self, key: "Hashable") -> "Optional[Any]":
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: "Hashable", value: "Any"):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)  # least recently used
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+
+from hlkit._typing import TYPE_CHECKING
+from hlkit.parse import PARSER_REVISION, ParseResult, ParseState, ScopeEvents
+from hlkit.syntax import SyntaxDefinition
+
+if TYPE_CHECKING:
+    from typing import Dict, List, Union
+
+    Highlighted = Union[List[ParseResult], List[ScopeEvents]]
+
+FORMAT_TOKENS = "tokens"
+FORMAT_EVENTS = "events"
+
+# bump when the stored layout changes, old entries are never hit again
+STORE_VERSION = 1
+
+# a hit only refreshes `atime` if it is older than this (in seconds), the
+# LRU order does not need more precision than that
+ATIME_RESOLUTION = 60.0
+
+# refreshed `atime`s are written in one transaction once this many are
+# pending, or with the next stored entry, or on `close`
+ATIME_BATCH = 64
+
+
+class DiskCache(object):
+    """
+    Persistent, content-addressed cache of highlighted documents
+
+    Entries are stored compressed in a SQLite file, keyed by the document
+    text, `SyntaxDefinition.digest`, `PARSER_REVISION` and the output
+    format. Once the total size exceeds `max_bytes`, least recently used
+    entries are evicted, entries larger than that are not stored.
+    The file can be shared by concurrent processes, every write is a
+    single transaction. Hits are read-only, access times are refreshed
+    coarsely and in batches, see `ATIME_RESOLUTION`.
+    """
+
+    path: str
+    max_bytes: int
+
+    atime_resolution: float
+
+    # key -> access time, not written yet
+    _pending_atimes: "Dict[str, float]"
+
+    hits: int
+    misses: int
+    evictions: int
+
+    _conn: sqlite3.Connection
+
+    def __init__(self, path: str, *, max_bytes: int = 64 * 1024 * 1024):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.atime_resolution = ATIME_RESOLUTION
+        self._pending_atimes = dict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # autocommit, transactions are opened explicitly
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " atime REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)"
+        )
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def flush(self):
+        """ write pending access times """
+        if len(self._pending_atimes) == 0:
+            return
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write_atimes()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def total_bytes(self) -> int:
+        row = self._conn.execute("SELECT SUM(size) FROM entries").fetchone()
+        return row[0] or 0
+
+    @property
+    def stats(self) -> "Dict[str, int]":
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self.__len__(),
+            "bytes": self.total_bytes,
+        }
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def make_key(syndef: SyntaxDefinition, text: str, fmt: str) -> str:
+        h = hashlib.sha256()
+        parts = (str(STORE_VERSION), str(PARSER_REVISION), syndef.digest, fmt)
+        for part in parts:
+            h.update(part.encode())
+            h.update(b"\0")
+        h.update(text.encode("utf-8", "surrogatepass"))
+        return h.hexdigest()
+
+    def highlight(
+        self,
+        syndef: SyntaxDefinition,
+        text: str,
+        *,
+        fmt: str = FORMAT_TOKENS,
+    ) -> "Highlighted":
+        """
+        Highlight `text` line by line, results are served from the cache
+        when possible.
+
+        :param fmt: `FORMAT_TOKENS` for a `ParseResult` per line,
+            `FORMAT_EVENTS` for a `ScopeEvents` per line
+        """
+        if fmt not in (FORMAT_TOKENS, FORMAT_EVENTS):
+            raise ValueError("unknown format: %s" % fmt)
+
+        key = self.make_key(syndef, text, fmt)
+        row = self._conn.execute(
+            "SELECT data, atime FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self.hits += 1
+            now = time.time()
+            if now - row[1] >= self.atime_resolution:
+                self._pending_atimes[key] = now
+                if len(self._pending_atimes) >= ATIME_BATCH:
+                    self.flush()
+            return self._decode(row[0], fmt)
+
+        self.misses += 1
+        result = self._parse(syndef, text, fmt)
+        self._store(key, self._encode(result, fmt))
+        return result
+
+    @staticmethod
+    def _parse(syndef: SyntaxDefinition, text: str, fmt: str) -> "Highlighted":
+        state = ParseState(syndef)
+        lines = text.splitlines(True)
+        if fmt == FORMAT_EVENTS:
+            return [state.parse_line_events(line) for line in lines]
+        return [state.parse_line(line) for line in lines]
+
+    @staticmethod
+    def _encode(result: "Highlighted", fmt: str) -> bytes:
+        if fmt == FORMAT_EVENTS:
+            payload = {"lines": [r.events for r in result]}
+        else:
+            # scope lists are interned, tokens refer to them by index
+            scopes_index: "Dict[tuple, int]" = dict()
+            lines = []
+            for line_result in result:
+                tokens = []
+                for token in line_result.tokens:
+                    scopes = tuple(token.scopes)
+                    index = scopes_index.setdefault(scopes, len(scopes_index))
+                    tokens.append((token.text, index))
+                lines.append(tokens)
+            payload = {"scopes": list(scopes_index), "lines": lines}
+
+        dumped = json.dumps(payload, separators=(",", ":"))
+        return zlib.compress(dumped.encode())
+
+    @staticmethod
+    def _decode(data: bytes, fmt: str) -> "Highlighted":
+        payload = json.loads(zlib.decompress(data).decode())
+        if fmt == FORMAT_EVENTS:
+            return [
+                ScopeEvents(*[tuple(e) for e in events])
+                for events in payload["lines"]
+            ]
+
+        scopes = payload["scopes"]
+        Token = ParseResult.Token
+        return [
+            ParseResult(*[Token(t, list(scopes[i])) for t, i in tokens])
+            for tokens in payload["lines"]
+        ]
+
+    def _store(self, key: str, data: bytes):
+        # it would evict everything, itself included
+        if len(data) > self.max_bytes:
+            return
+
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # before evicting, so that recently hit entries are kept
+            self._write_atimes()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            total = conn.execute("SELECT SUM(size) FROM entries").fetchone()[0]
+            while total > self.max_bytes:
+                key_, size = conn.execute(
+                    "SELECT key, size FROM entries ORDER BY atime LIMIT 1"
+                ).fetchone()
+                conn.execute("DELETE FROM entries WHERE key = ?", (key_,))
+                total -= size
+                self.evictions += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _write_atimes(self):
+        """ within a write transaction """
+        self._conn.executemany(
+            "UPDATE entries SET atime = ? WHERE key = ?",
+            [(atime, key) for key, atime in self._pending_atimes.items()],
+        )
+        self._pending_atimes.clear()
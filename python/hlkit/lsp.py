@@ -0,0 +1,286 @@
+"""
+LSP semantic tokens
+
+Encodes parsed lines into the `data` array of a `textDocument/semanticTokens`
+response: five integers per token, `deltaLine, deltaStart, length,
+tokenType, tokenModifiers`, positions relative to the previous token and
+counted in UTF-16 code units unless negotiated otherwise.
+"""
+from hlkit._typing import TYPE_CHECKING
+from hlkit.offsets import UTF16
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Optional, Tuple
+
+    from hlkit.parse import ParseResult, ParseState
+
+# standard token types and modifiers of the LSP specification
+TOKEN_TYPES = [
+    "namespace",
+    "type",
+    "class",
+    "enum",
+    "interface",
+    "struct",
+    "typeParameter",
+    "parameter",
+    "variable",
+    "property",
+    "enumMember",
+    "event",
+    "function",
+    "method",
+    "macro",
+    "keyword",
+    "modifier",
+    "comment",
+    "string",
+    "number",
+    "regexp",
+    "operator",
+]
+
+TOKEN_MODIFIERS = [
+    "declaration",
+    "definition",
+    "readonly",
+    "static",
+    "deprecated",
+    "abstract",
+    "async",
+    "modification",
+    "documentation",
+    "defaultLibrary",
+]
+
+# scope prefix -> token type, the innermost scope with a known prefix wins
+SCOPE_TYPES = {
+    "comment": "comment",
+    "string.regexp": "regexp",
+    "string": "string",
+    "constant.numeric": "number",
+    "constant.language": "keyword",
+    "constant.character.escape": "string",
+    "keyword.operator": "operator",
+    "keyword": "keyword",
+    "storage.type": "keyword",
+    "storage.modifier": "modifier",
+    "entity.name.namespace": "namespace",
+    "entity.name.class": "class",
+    "entity.name.struct": "struct",
+    "entity.name.enum": "enum",
+    "entity.name.interface": "interface",
+    "entity.name.type": "type",
+    "entity.name.function": "function",
+    "entity.name.constant": "variable",
+    "entity.other.inherited-class": "class",
+    "support.class": "class",
+    "support.type": "type",
+    "support.function": "function",
+    "support.constant": "variable",
+    "variable.parameter": "parameter",
+    "variable.function": "function",
+    "variable.other.member": "property",
+    "variable": "variable",
+}
+
+# scope prefix -> token modifier, every scope of a token contributes
+SCOPE_MODIFIERS = {
+    "entity.name": "declaration",
+    "support": "defaultLibrary",
+    "constant.language": "readonly",
+    "entity.name.constant": "readonly",
+    "comment.block.documentation": "documentation",
+}
+
+
+class SemanticTokensLegend(object):
+    """ token types and modifiers of the server, with their scope rules """
+
+    token_types: "List[str]"
+    token_modifiers: "List[str]"
+
+    # scope prefix -> index in `token_types`
+    _types: "Dict[str, int]"
+
+    # scope prefix -> bit of `token_modifiers`
+    _modifiers: "Dict[str, int]"
+
+    # scope -> (type index or -1, modifier bits), scopes repeat a lot
+    _classified: "Dict[str, Tuple[int, int]]"
+
+    def __init__(
+        self,
+        token_types: "List[str]" = TOKEN_TYPES,
+        token_modifiers: "List[str]" = TOKEN_MODIFIERS,
+        *,
+        scope_types: "Dict[str, str]" = SCOPE_TYPES,
+        scope_modifiers: "Dict[str, str]" = SCOPE_MODIFIERS,
+    ):
+        self.token_types = list(token_types)
+        self.token_modifiers = list(token_modifiers)
+        self._types = dict()
+        self._modifiers = dict()
+        self._classified = dict()
+
+        # rules for types or modifiers the client does not know are dropped
+        for prefix, token_type in scope_types.items():
+            if token_type in self.token_types:
+                self._types[prefix] = self.token_types.index(token_type)
+        for prefix, modifier in scope_modifiers.items():
+            if modifier in self.token_modifiers:
+                bit = 1 << self.token_modifiers.index(modifier)
+                self._modifiers[prefix] = bit
+
+    def to_dict(self) -> "Dict[str, List[str]]":
+        """ the `legend` of `SemanticTokensOptions` """
+        return {
+            "tokenTypes": list(self.token_types),
+            "tokenModifiers": list(self.token_modifiers),
+        }
+
+    def classify(self, scopes: "List[str]") -> "Optional[Tuple[int, int]]":
+        """ `(token type, modifier bits)` of a token, `None` if not mapped """
+        token_type = -1
+        modifiers = 0
+
+        for scope in reversed(scopes):
+            classified = self._classified.get(scope)
+            if classified is None:
+                classified = self._classify_scope(scope)
+                self._classified[scope] = classified
+
+            if token_type < 0:
+                token_type = classified[0]
+            modifiers |= classified[1]
+
+        if token_type < 0:
+            return None
+        return token_type, modifiers
+
+    def _classify_scope(self, scope: str) -> "Tuple[int, int]":
+        token_type = -1
+        modifiers = 0
+
+        # a scope field may hold several scopes: `meta.key string.quoted`
+        for name in reversed(scope.split()):
+            # longest prefix first: `string.regexp.x` -> `string.regexp`
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if token_type < 0:
+                    token_type = self._types.get(prefix, -1)
+                modifiers |= self._modifiers.get(prefix, 0)
+
+        return token_type, modifiers
+
+
+class SemanticTokensBuilder(object):
+    """
+    Incremental encoder of semantic tokens, fed one line after another
+
+        builder = SemanticTokensBuilder(ParseState(syndef), legend)
+        for line in text.splitlines(True):
+            builder.feed(line)
+        response = {"data": builder.data}
+
+    Adjacent tokens of the same type and modifiers are merged, line
+    terminators are never part of a token.
+    """
+
+    state: "ParseState"
+    legend: SemanticTokensLegend
+
+    # unit of `deltaStart` and `length`, see `hlkit.offsets`
+    encoding: str
+
+    data: "List[int]"
+
+    # number of lines fed so far
+    line: int
+
+    # absolute (line, start) of the last encoded token
+    _last_line: int
+    _last_start: int
+
+    def __init__(
+        self,
+        state: "ParseState",
+        legend: SemanticTokensLegend,
+        *,
+        encoding: str = UTF16,
+    ):
+        self.state = state
+        self.legend = legend
+        self.encoding = encoding
+        self.data = list()
+        self.line = 0
+        self._last_line = 0
+        self._last_start = 0
+
+    def feed(self, line: str):
+        """ parse and encode the next line of the document """
+        result = self.state.parse_line(line, offsets=self.encoding)
+        self.add_line(result)
+
+    def add_line(self, result: "ParseResult"):
+        """
+        encode the next line, already parsed with `offsets=self.encoding`
+        """
+        # pending merged token: start, end, type, modifiers
+        pending: "Optional[List[int]]" = None
+
+        for token in result.tokens:
+            if token.start is None:
+                raise ValueError("tokens have no offsets, see `parse_line`")
+
+            classified = self.legend.classify(token.scopes)
+            if classified is None:
+                continue
+
+            # every terminator char is one unit wide in all encodings
+            terminator = len(token.text) - len(token.text.rstrip("\r\n"))
+            end = token.end - terminator
+            if end <= token.start:
+                continue
+
+            if (
+                pending is not None
+                and pending[1] == token.start
+                and pending[2:] == list(classified)
+            ):
+                pending[1] = end
+                continue
+
+            if pending is not None:
+                self._append(*pending)
+            pending = [token.start, end, classified[0], classified[1]]
+
+        if pending is not None:
+            self._append(*pending)
+        self.line += 1
+
+    def _append(self, start: int, end: int, token_type: int, modifiers: int):
+        delta_line = self.line - self._last_line
+        delta_start = start - self._last_start if delta_line == 0 else start
+        self.data.extend(
+            [delta_line, delta_start, end - start, token_type, modifiers]
+        )
+        self._last_line = self.line
+        self._last_start = start
+
+
+def semantic_tokens(
+    state: "ParseState",
+    lines: "Iterable[str]",
+    legend: "Optional[SemanticTokensLegend]" = None,
+    *,
+    encoding: str = UTF16,
+) -> "List[int]":
+    """ `data` of a full `textDocument/semanticTokens` response """
+    if legend is None:
+        legend = SemanticTokensLegend()
+    builder = SemanticTokensBuilder(state, legend, encoding=encoding)
+    for line in lines:
+        builder.feed(line)
+    return builder.data
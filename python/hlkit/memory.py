@@ -0,0 +1,200 @@
+"""
+Approximate memory footprint of grammars and parse states
+
+    >>> syntax_memory(syndef)
+    <MemoryUsage 412.3 KiB: compiled=..., contexts=..., ...>
+
+Sizes are `sys.getsizeof` summed over the objects reachable from the root,
+each object counted once. Objects shared with other roots (interned strings,
+other syntaxes, the grammar behind a `ParseState`) are not followed, so the
+numbers are estimates meant for sizing workers, not exact accounting.
+"""
+import re
+import sys
+import weakref
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+from hlkit._typing import TYPE_CHECKING
+from hlkit.cache import LineCache
+from hlkit.parse import ParseState, StateLevel
+from hlkit.pool import GrammarPool
+from hlkit.syntax import (
+    MatchAction,
+    MatchRegex,
+    SyntaxContext,
+    SyntaxDefinition,
+    SyntaxPattern,
+)
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Tuple
+
+# objects starting a category, everything they reach belongs to it
+TYPE_CATEGORIES = {
+    re.Pattern: "compiled",
+    MatchRegex: "regexes",
+}
+
+# categories of attributes of the root object, others fall into `"other"`
+SYNTAX_CATEGORIES = {
+    "contexts": "contexts",
+    "_flattened": "flattened",
+    "variables": "variables",
+    "_expanded_variables": "variables",
+}
+
+STATE_CATEGORIES = {
+    "level_stack": "levels",
+    "_flat_runs": "levels",
+    "event_scopes": "scopes",
+    "line_cache": "line_cache",
+}
+
+# attributes holding lists owned by the grammar
+SHARED_ATTRIBUTES = {
+    StateLevel: ("matches",),
+}
+
+# never followed: owned by someone else, or not data at all
+OPAQUE_TYPES = (
+    type,
+    ModuleType,
+    FunctionType,
+    BuiltinFunctionType,
+    MethodType,
+    SyntaxDefinition,
+    GrammarPool,
+    LineCache,
+)
+
+GRAMMAR_TYPES = (SyntaxContext, SyntaxPattern, MatchAction, MatchRegex)
+
+
+class MemoryUsage(object):
+    """ approximate bytes retained by an object, by category """
+
+    parts: "Dict[str, int]"
+
+    # number of objects counted
+    objects: int
+
+    def __init__(self):
+        self.parts = dict()
+        self.objects = 0
+
+    @property
+    def total(self) -> int:
+        return sum(self.parts.values())
+
+    def __getitem__(self, category: str) -> int:
+        return self.parts.get(category, 0)
+
+    def __repr__(self):
+        items = sorted(self.parts.items())
+        parts = ", ".join("%s=%d" % item for item in items)
+        return "<MemoryUsage %.1f KiB: %s>" % (self.total / 1024, parts)
+
+
+def syntax_memory(syndef: SyntaxDefinition) -> MemoryUsage:
+    """
+    footprint of a loaded definition, compiled regexes included (regexes are
+    compiled on first use, so it grows while documents are parsed)
+    """
+    usage = MemoryUsage()
+    roots = [(syndef, "other")]
+    _walk(usage, _attribute_roots(syndef, SYNTAX_CATEGORIES), roots)
+    return usage
+
+
+def state_memory(state: ParseState) -> MemoryUsage:
+    """
+    footprint of a live parse state, without its grammar, `line_cache` is
+    reported apart since it may be shared
+    """
+    usage = MemoryUsage()
+    roots = _attribute_roots(state, STATE_CATEGORIES)
+
+    # the cache is opaque elsewhere, its entries are not
+    line_cache = state.line_cache
+    if line_cache is not None:
+        roots = [r for r in roots if r[0] is not line_cache]
+        roots.append((line_cache.__dict__, "line_cache"))
+        usage.parts["line_cache"] = sys.getsizeof(line_cache)
+
+    _walk(usage, roots, [(state, "other")], skip=GRAMMAR_TYPES)
+    return usage
+
+
+def pool_memory(pool: GrammarPool) -> "Dict[str, MemoryUsage]":
+    """ footprint of every loaded definition of `pool`, by scope """
+    return dict(
+        (syndef.scope, syntax_memory(syndef)) for syndef in pool.loaded
+    )
+
+
+def _attribute_roots(
+    obj, categories: "Dict[str, str]"
+) -> "List[Tuple[object, str]]":
+    return [
+        (value, categories.get(name, "other"))
+        for name, value in vars(obj).items()
+    ]
+
+
+def _walk(
+    usage: MemoryUsage,
+    roots: "Iterable[Tuple[object, str]]",
+    owners: "Iterable[Tuple[object, str]]",
+    *,
+    skip: "Tuple[type, ...]" = (),
+):
+    """
+    add everything reachable from `roots` to `usage`, `owners` are counted
+    (with their `__dict__`) without being followed
+    """
+    seen = set()
+
+    for owner, category in owners:
+        seen.add(id(owner))
+        seen.add(id(owner.__dict__))
+        size = sys.getsizeof(owner) + sys.getsizeof(owner.__dict__)
+        usage.parts[category] = usage.parts.get(category, 0) + size
+        usage.objects += 1
+
+    stack = list(roots)
+    while stack:
+        obj, category = stack.pop()
+        if id(obj) in seen:
+            continue
+
+        cls = type(obj)
+        if cls in weakref.ProxyTypes:
+            # count the proxy, its referent is owned elsewhere
+            seen.add(id(obj))
+            size = sys.getsizeof(obj)
+            usage.parts[category] = usage.parts.get(category, 0) + size
+            usage.objects += 1
+            continue
+        if issubclass(cls, OPAQUE_TYPES) or issubclass(cls, skip):
+            continue
+
+        seen.add(id(obj))
+        category = TYPE_CATEGORIES.get(cls, category)
+        size = sys.getsizeof(obj)
+        usage.parts[category] = usage.parts.get(category, 0) + size
+        usage.objects += 1
+
+        if isinstance(obj, dict):
+            stack.extend((key, category) for key in obj.keys())
+            stack.extend((value, category) for value in obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend((item, category) for item in obj)
+        elif hasattr(obj, "__dict__"):
+            attributes = obj.__dict__
+            seen.add(id(attributes))
+            usage.parts[category] += sys.getsizeof(attributes)
+
+            shared = SHARED_ATTRIBUTES.get(cls, ())
+            for name, value in attributes.items():
+                if name not in shared:
+                    stack.append((value, category))
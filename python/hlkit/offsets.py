@@ -0,0 +1,81 @@
+"""
+Offsets of a line in other units than code points
+
+Editors and LSP clients count columns in UTF-16 code units or UTF-8 bytes,
+`ParseState` counts code points. `OffsetIndex` converts offsets of one line,
+computed once per line so tokens are never re-encoded one by one.
+"""
+import re
+from itertools import accumulate
+
+from hlkit._typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import List, Optional
+
+CODEPOINT = "codepoint"
+UTF16 = "utf-16"
+UTF8 = "utf-8"
+
+ENCODINGS = (CODEPOINT, UTF16, UTF8)
+
+# characters taking two UTF-16 code units (a surrogate pair)
+ASTRAL_RE = re.compile("[\U00010000-\U0010ffff]")
+
+
+def _utf16_width(c: str) -> int:
+    return 2 if c > "\uffff" else 1
+
+
+def _utf8_width(c: str) -> int:
+    if c < "\x80":
+        return 1
+    elif c < "\u0800":
+        return 2
+    elif c < "\U00010000":
+        return 3
+    return 4
+
+
+class OffsetIndex(object):
+    """
+    code point offsets of a line -> offsets in `encoding` units
+
+    Lines where every code point is one unit wide (ASCII lines, or lines
+    without astral characters for UTF-16) are not indexed at all.
+    """
+
+    encoding: str
+
+    # units before each code point offset, `None` if offsets are unchanged
+    _units: "Optional[List[int]]"
+
+    def __init__(self, line: str, encoding: str = UTF16):
+        if encoding not in ENCODINGS:
+            raise ValueError("unknown offset encoding: %r" % encoding)
+
+        self.encoding = encoding
+        self._units = None
+
+        if encoding == CODEPOINT or line.isascii():
+            return
+
+        if encoding == UTF16:
+            if ASTRAL_RE.search(line) is None:
+                return
+            widths = map(_utf16_width, line)
+        else:
+            widths = map(_utf8_width, line)
+
+        self._units = [0]
+        self._units.extend(accumulate(widths))
+
+    @property
+    def is_identity(self) -> bool:
+        return self._units is None
+
+    def __getitem__(self, offset: int) -> int:
+        """ `offset` in code points -> offset in `encoding` units """
+        if self._units is None:
+            return offset
+        return self._units[offset]
@@ -1,11 +1,17 @@
-from ._onig import ffi, lib
+def _onig():
+    """ cffi extension, imported on first use to keep `import hlkit` cheap """
+    from . import _onig
+
+    return _onig
 
 
 def version() -> str:
-    ver = ffi.string(lib.onig_version())
+    onig = _onig()
+    ver = onig.ffi.string(onig.lib.onig_version())
     return ver.decode()
 
 
 def copyright() -> str:
-    info = ffi.string(lib.onig_copyright())
+    onig = _onig()
+    info = onig.ffi.string(onig.lib.onig_copyright())
     return info.decode()
@@ -1,8 +1,9 @@
-import re
-from typing import List, Match, Optional, Tuple
-
+from hlkit._typing import TYPE_CHECKING
+from hlkit.cache import LineCache
+from hlkit.offsets import OffsetIndex
 from hlkit.syntax import (
-    IncludePattern,
+    EmbedAction,
+    EscapeAction,
     MatchPattern,
     PopAction,
     PushAction,
@@ -13,19 +14,50 @@ from hlkit.syntax import (
     obj_proxy,
 )
 
+if TYPE_CHECKING:
+    from typing import (
+        Callable,
+        Dict,
+        Iterator,
+        List,
+        Match,
+        Optional,
+        Tuple,
+        Union,
+    )
+
+
+# bump when a change makes `ParseState` output other tokens for the same
+# grammar and text, persisted results (`hlkit.diskcache`) are then ignored
+PARSER_REVISION = 1
+
+# what `ParseState` does when a push would exceed `max_depth`
+OVERFLOW_RAISE = "raise"  # raise `StackDepthError`
+OVERFLOW_DEGRADE = "degrade"  # push a context adding no scopes
+
+
+class StackDepthError(ValueError):
+    """ `ParseState.level_stack` would grow beyond `max_depth` """
+
 
 class ParseResult(object):
     """ 代码的解析结果 """
 
-    tokens: List["Token"]
+    tokens: "List[Token]"
 
     class Token(object):
         text: str
-        scopes: List[str]
+        scopes: "List[str]"
+
+        # position in the line, only set by `parse_line(..., offsets=)`
+        start: "Optional[int]"
+        end: "Optional[int]"
 
-        def __init__(self, text, scopes):
+        def __init__(self, text, scopes, start=None, end=None):
             self.text = text
             self.scopes = scopes
+            self.start = start
+            self.end = end
 
     def __init__(self, *tokens):
         self.tokens = list(tokens)
@@ -38,63 +70,342 @@ class ParseResult(object):
         # count for parsed characters
         return sum(map(lambda t: len(t.text), self.tokens))
 
-    def extend(self, token_list: List[Token]):
+    def extend(self, token_list: "List[Token]"):
         self.tokens.extend(token_list)
 
 
+class ScopeEvents(object):
+    """
+    代码的解析结果, as scope change events (like syntect's `ScopeStackOp`)
+
+    Each event is a tuple `(offset, op, value)`:
+      - `(offset, PUSH, scope)`: `scope` is opened at `offset`
+      - `(offset, POP, scope)`: innermost opened `scope` is closed at `offset`
+      - `(offset, TEXT, text)`: `text` starts at `offset`, with the scopes
+        opened so far
+    """
+
+    PUSH = "push"
+    POP = "pop"
+    TEXT = "text"
+
+    events: "List[Tuple[int, str, str]]"
+
+    def __init__(self, *events):
+        self.events = list(events)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    @property
+    def tokens_count(self) -> int:
+        return sum(1 for e in self.events if e[1] == self.TEXT)
+
+
 class StateLevel(object):
     current_ctx: SyntaxContext
-    prototypes: List[SyntaxPattern]
-    matches: List[MatchPattern]  # flatten `MatchPattern`
+    prototypes: "List[SyntaxPattern]"
+    matches: "List[MatchPattern]"  # flatten `MatchPattern`
+
+    # action which pushed another syntax at this level
+    embed: "Optional[EmbedAction]"
+
+    # `embed.escape`, back references replaced by the groups of the embed match
+    escape: "Optional[MatchPattern]"
+
+    # index of the innermost level with `embed`, see `ParseState._level_at`
+    escape_level: "Optional[int]"
+
+    # scopes added by the level: embed scope, meta scope, meta content scope
+    scopes: "Tuple[str, ...]"
+
+    # `scopes` without the meta scope, for the token popping the level
+    content_scopes: "Tuple[str, ...]"
+
+    # pushed beyond `ParseState.max_depth`: adds no scopes, and may be
+    # shared by several positions of the stack
+    flat: bool
 
-    def __init__(self, ctx):
+    # index following `scopes` in `ParseState.current_scopes()`
+    scope_end: int
+
+    def __init__(
+        self,
+        ctx,
+        *,
+        embed=None,
+        escape=None,
+        escape_level=None,
+        scope_start=0,
+        flat=False,
+    ):
         self.current_ctx = obj_proxy(ctx)
-        self.matches = []
-
-        if self.current_ctx.meta_include_prototype is True:
-            proto_patterns = self.current_ctx.syndef.prototype_patterns
-            proto_flattens = self._flatten_patterns(proto_patterns)
-            self.matches.extend(proto_flattens)
-
-        self.matches.extend(self._flatten_patterns(self.current_ctx.patterns))
-
-    @staticmethod
-    def _flatten_patterns(patterns: List[SyntaxPattern]) -> List[MatchPattern]:
-        """ Get flatten `MatchPattern` list """
-        result = []
-        for pattern in patterns:
-            if isinstance(pattern, MatchPattern):
-                result.append(obj_proxy(pattern))
-            elif isinstance(pattern, IncludePattern):
-                pats = StateLevel._flatten_patterns(pattern.context.patterns)
-                result.extend(pats)
-            else:
-                raise ValueError
-        return result
+        # flattened ahead of time by `SyntaxDefinition.link`, shared
+        self.matches = self.current_ctx.matches
+        self.embed = embed
+        if escape is None and embed is not None:
+            escape = embed.escape
+        self.escape = escape
+        self.escape_level = escape_level
+        self.flat = flat
+
+        if flat:
+            self.scopes = self.content_scopes = ()
+            self.scope_end = scope_start
+            return
+
+        # TODO: clear_scopes
+        content_scopes = []
+        if embed is not None and embed.embed_scope is not None:
+            content_scopes.append(embed.embed_scope)
+        scopes = list(content_scopes)
+        if ctx.meta_scope is not None:
+            scopes.append(ctx.meta_scope)
+        if ctx.meta_content_scope is not None:
+            scopes.append(ctx.meta_content_scope)
+            content_scopes.append(ctx.meta_content_scope)
+
+        self.scopes = tuple(scopes)
+        self.content_scopes = tuple(content_scopes)
+        self.scope_end = scope_start + len(scopes)
+
+    @property
+    def key(self) -> "Union[int, Tuple[int, int, str]]":
+        """ hashable identity of the level, see `ParseState.fingerprint` """
+        if self.embed is None:
+            return self.current_ctx.link_id
+        return self.current_ctx.link_id, id(self.embed), str(self.escape.match)
 
 
 class ParseState(object):
     syndef: SyntaxDefinition  # ProxyType
-    level_stack: List["StateLevel"]
 
-    def __init__(self, syndef: SyntaxDefinition):
+    # strong reference, so a pool evicting the definition cannot free it
+    # while the state is alive
+    _syndef_ref: SyntaxDefinition
+    level_stack: "List[StateLevel]"
+
+    # scopes opened by events emitted so far, see `parse_line_events`
+    event_scopes: "List[str]"
+
+    # number of bottom levels whose `scopes` still start `event_scopes`,
+    # -1 if not even the syntax scope does
+    _event_levels: int
+
+    # scope of the syntax, below the scopes of every level
+    _root_scopes: "Tuple[str, ...]"
+
+    # last `_scopes_at` result, with the level it ends with: a level is
+    # only ever found above the same levels
+    _scopes_memo: "Optional[Tuple[StateLevel, List[str]]]"
+
+    # optional memo of `parse_line`
+    line_cache: "Optional[LineCache]"
+
+    # limit of `level_stack` length, `None` for no limit
+    max_depth: "Optional[int]"
+    on_overflow: str
+
+    # flat levels pushed by `OVERFLOW_DEGRADE`, by context and embed
+    _flat_levels: "Dict[Tuple, StateLevel]"
+
+    # number of levels pushed beyond `max_depth`, only the innermost of
+    # them is in `level_stack`
+    flat_depth: int
+
+    # `[level, count]` runs of the levels pushed beyond `max_depth`,
+    # outermost first: thousands of nested `[` are a single run
+    _flat_runs: "List[List]"
+
+    def __init__(
+        self,
+        syndef: SyntaxDefinition,
+        *,
+        line_cache: "Optional[LineCache]" = None,
+        max_depth: "Optional[int]" = None,
+        on_overflow: str = OVERFLOW_RAISE,
+    ):
+        """
+        :param line_cache: memo of parsed lines, keyed by the state
+            fingerprint and the line text
+        :param max_depth: limit of nested contexts, so that unbalanced
+            input (e.g. thousands of `[` in JSON) cannot grow the state
+            without bound
+        :param on_overflow: `OVERFLOW_RAISE` or `OVERFLOW_DEGRADE`, the
+            latter keeps parsing deeper contexts, highlighted with the
+            scopes of the `max_depth` outer ones only
+        """
+        if max_depth is not None and max_depth <= 0:
+            raise ValueError("max_depth must be positive")
+        if on_overflow not in (OVERFLOW_RAISE, OVERFLOW_DEGRADE):
+            raise ValueError("unknown on_overflow: %r" % on_overflow)
+
+        self._syndef_ref = syndef
         self.syndef = obj_proxy(syndef)
         self.level_stack = list()
+        self.event_scopes = list()
+        self._event_levels = -1
+        self._root_scopes = ()
+        self._scopes_memo = None
+        if self.syndef.scope is not None:
+            self._root_scopes = (self.syndef.scope,)
+        self.line_cache = line_cache
+        self.max_depth = max_depth
+        self.on_overflow = on_overflow
+        self._flat_levels = dict()
+        self.flat_depth = 0
+        self._flat_runs = list()
 
         # push `main` context into `level_stack`
         self.push_context(self.syndef.ctx_main)
 
-    def push_context(self, context: SyntaxContext):
-        level = StateLevel(context)
-        self.level_stack.append(level)
+    def push_context(
+        self,
+        context: SyntaxContext,
+        *,
+        embed: "Optional[EmbedAction]" = None,
+        escape: "Optional[MatchPattern]" = None,
+    ):
+        if self.max_depth is not None and self.depth >= self.max_depth:
+            if self.on_overflow == OVERFLOW_RAISE:
+                message = "more than %d nested contexts" % self.max_depth
+                raise StackDepthError(message)
+
+        if embed is not None:
+            escape_level = self.depth
+        elif len(self.level_stack) > 0:
+            escape_level = self.current_level.escape_level
+        else:
+            escape_level = None
+        self._append_level(context, embed, escape, escape_level)
 
     def pop_context(self):
+        if self.flat_depth > 0:
+            self._truncate(self.depth - 1)
+            return
         self.level_stack.pop()
+        self._event_levels = min(self._event_levels, len(self.level_stack))
 
     def set_context(self, context: SyntaxContext):
-        level = StateLevel(context)
-        self.level_stack.pop()
-        self.level_stack.append(level)
+        old_level = self.current_level
+        self._truncate(self.depth - 1)
+        self._append_level(
+            context, old_level.embed, old_level.escape, old_level.escape_level
+        )
+
+    def _append_level(self, context, embed, escape, escape_level):
+        depth = self.depth
+        scope_start = self._scope_end(depth)
+        if self.max_depth is None or depth < self.max_depth:
+            level = StateLevel(
+                context,
+                embed=embed,
+                escape=escape,
+                escape_level=escape_level,
+                scope_start=scope_start,
+            )
+            self.level_stack.append(level)
+            return
+
+        # thousands of nested `[` cost one flat level and a count
+        key = (context.link_id, id(embed), id(escape), escape_level)
+        level = self._flat_levels.get(key)
+        if level is None:
+            level = StateLevel(
+                context,
+                embed=embed,
+                escape=escape,
+                escape_level=escape_level,
+                scope_start=scope_start,
+                flat=True,
+            )
+            self._flat_levels[key] = level
+
+        runs = self._flat_runs
+        if len(runs) > 0 and runs[-1][0] is level:
+            runs[-1][1] += 1
+        else:
+            runs.append([level, 1])
+        if self.flat_depth == 0:
+            self.level_stack.append(level)
+        else:
+            self.level_stack[-1] = level
+        self.flat_depth += 1
+
+    def _truncate(self, depth: int):
+        """ pop levels until `depth` of them are left """
+        if self.flat_depth > 0:
+            excess = self.depth - depth
+            runs = self._flat_runs
+            while excess > 0 and len(runs) > 0:
+                run = runs[-1]
+                count = min(run[1], excess)
+                run[1] -= count
+                self.flat_depth -= count
+                excess -= count
+                if run[1] == 0:
+                    runs.pop()
+            if len(runs) > 0:
+                self.level_stack[-1] = runs[-1][0]
+                return
+            self.level_stack.pop()
+
+        del self.level_stack[depth:]
+        self._event_levels = min(self._event_levels, depth)
+
+    def escape_embed(self, escape: "Optional[MatchPattern]" = None):
+        """
+        pop the embedded syntax escaped by `escape`, and those it embeds
+        (the innermost one by default)
+        """
+        escape_level = self.current_level.escape_level
+        if escape is not None:
+            for level in self._escape_levels():
+                if self._level_at(level).escape is escape:
+                    escape_level = level
+                    break
+        self._truncate(escape_level)
+
+    def _escape_levels(self) -> "Iterator[int]":
+        """ levels of the embedded syntaxes, innermost first """
+        escape_level = self.current_level.escape_level
+        while escape_level is not None:
+            yield escape_level
+            if escape_level == 0:
+                break
+            escape_level = self._level_at(escape_level - 1).escape_level
+
+    def _level_at(self, index: int) -> StateLevel:
+        """ level at `index` of the stack, flat levels counted one by one """
+        if self.flat_depth == 0 or index < len(self.level_stack) - 1:
+            return self.level_stack[index]
+        index -= len(self.level_stack) - 1
+        for level, count in self._flat_runs:
+            if index < count:
+                return level
+            index -= count
+        raise IndexError(index)
+
+    @property
+    def depth(self) -> int:
+        """ number of nested contexts, flat levels included """
+        if self.flat_depth == 0:
+            return len(self.level_stack)
+        return len(self.level_stack) - 1 + self.flat_depth
+
+    @property
+    def overflow(self) -> int:
+        """ number of flat levels, pushed beyond `max_depth` """
+        return self.flat_depth
+
+    @property
+    def fingerprint(self) -> "Tuple":
+        """ cheap hashable identity of `level_stack` """
+        key = tuple(level.key for level in self.level_stack)
+        if self.flat_depth > 0:
+            runs = tuple((level.key, n) for level, n in self._flat_runs)
+            key += (("overflow", runs),)
+        return key
 
     @property
     def current_level(self) -> StateLevel:
@@ -104,39 +415,85 @@ class ParseState(object):
     def current_context(self) -> SyntaxContext:
         return self.current_level.current_ctx
 
-    def current_scopes(self, *, with_meta_scope=True) -> List[str]:
-        scopes = []
-
-        if self.syndef.scope is not None:
-            scopes.append(self.syndef.scope)
-
-        for i in range(len(self.level_stack)):
-            level = self.level_stack[i]
-            is_not_last = i < len(self.level_stack) - 1
+    def current_scopes(self, *, with_meta_scope=True) -> "List[str]":
+        if with_meta_scope:
+            return self._scopes_at(len(self.level_stack))
 
-            # TODO: clear_scopes
-            ctx = level.current_ctx
+        scopes = self._scopes_at(len(self.level_stack) - 1)
+        scopes.extend(self.current_level.content_scopes)
+        return scopes
 
-            if is_not_last or with_meta_scope:
-                if ctx.meta_scope is not None:
-                    scopes.append(ctx.meta_scope)
+    def _scopes_at(self, depth: int) -> "List[str]":
+        """ scopes of the syntax and of the `depth` bottom levels """
+        depth = self._scoped_depth(depth)
+        if depth == 0:
+            return list(self._root_scopes)
+
+        top = self.level_stack[depth - 1]
+        memo = self._scopes_memo
+        if memo is not None and memo[0] is top:
+            return memo[1].copy()
+
+        scopes = list(self._root_scopes)
+        for level in self.level_stack[:depth]:
+            scopes.extend(level.scopes)
+        self._scopes_memo = (top, scopes.copy())
+        return scopes
 
-            if ctx.meta_content_scope is not None:
-                scopes.append(ctx.meta_content_scope)
+    def _scope_end(self, depth: int) -> int:
+        """ `len(self._scopes_at(depth))`, without building it """
+        depth = self._scoped_depth(depth)
+        if depth == 0:
+            return len(self._root_scopes)
+        return self.level_stack[depth - 1].scope_end
 
-        return scopes
+    def _scoped_depth(self, depth: int) -> int:
+        """ `depth` without the flat levels, which add no scopes """
+        if self.max_depth is not None and depth > self.max_depth:
+            return self.max_depth
+        return depth
 
-    def find_best_match(self, code) -> Tuple[MatchPattern, Match]:
+    def find_best_match(self, code) -> "Tuple[MatchPattern, Match]":
         """
         找到最佳匹配的 MatchPattern 以及其正则匹配的结果
         """
-        best_pattern: Optional[MatchPattern] = None
-        best_match: Optional[Match] = None
+        best_pattern: "Optional[MatchPattern]" = None
+        best_match: "Optional[Match]" = None
+
+        # escapes of the embedded syntaxes have the highest priority, and
+        # nothing embedded can match beyond the first of them
+        limit = len(code)
+        for escape_level in self._escape_levels():
+            escape = self._level_at(escape_level).escape
+            escape_match = escape.match.search(code)
+            if escape_match is None:
+                continue
+            if escape_match.start() == 0:
+                return escape, escape_match
+            if best_match is None or escape_match.start() < limit:
+                best_pattern = escape
+                best_match = escape_match
+                limit = escape_match.start()
 
         for pattern in self.current_level.matches:
-            match = re.search(str(pattern.match), code)
+            # rule out (or bound) the search with a cheap scan first
+            pos = 0
+            prefilter = pattern.match.prefilter
+            if prefilter is not None:
+                pos = prefilter.find(code)
+                if pos < 0:
+                    continue
+                if best_match is not None and pos >= best_match.start():
+                    continue
+
+            match = pattern.match.search(code, pos)
             if match is None:
                 continue
+            if match.start() < limit < match.end():
+                # lookaheads see the whole line, the match stops at the escape
+                match = pattern.match.search(code, pos, limit)
+                if match is None:
+                    continue
 
             if match.start() == 0:
                 return pattern, match
@@ -152,52 +509,77 @@ class ParseState(object):
         return best_pattern, best_match
 
     def parse_next_token(self, line, start=0) -> ParseResult:
+        result = ParseResult()
+
+        def emit(text, depth, tail):
+            scopes = self._scopes_at(depth)
+            scopes.extend(tail)
+            result.tokens.append(ParseResult.Token(text, scopes))
+
+        self._next_token(line, start, emit)
+        return result
+
+    def _next_token(
+        self, line, start, emit: "Callable[[str, int, List[str]], None]"
+    ):
+        """
+        Parse the token(s) at `start`, calling `emit(text, depth, tail)` for
+        each of them, in order. Their scopes are those of the `depth` bottom
+        levels of `level_stack`, at the time of the call, then `tail`.
+        """
         snippet: str = line[start:]
         pattern, match = self.find_best_match(snippet)
 
-        result = ParseResult()
-
-        scopes = self.current_scopes()
+        depth = len(self.level_stack)
 
         if pattern is None:
-            token = ParseResult.Token(line[start:], scopes.copy())
-            result.tokens.append(token)
-            return result
+            emit(snippet, depth, [])
+            return
 
         snippet = snippet[: match.end()]
 
         # 未匹配的文本赋予默认 scopes
         if match.start() > 0:
-            text = snippet[: match.start()]
-            token = ParseResult.Token(text, scopes.copy())
-            result.tokens.append(token)
+            emit(snippet[: match.start()], depth, [])
+
+        # execute action, scopes above the unchanged levels go to `tail`
+        tail = []
 
-        # execute action
-        if isinstance(pattern.action, PushAction):
+        if isinstance(pattern.action, EmbedAction):
+            action = pattern.action
+            escape = action.escape.with_backrefs(match)
+            self.push_context(action.context, embed=action, escape=escape)
+
+        elif isinstance(pattern.action, EscapeAction):
+            self.escape_embed(pattern)
+            depth = len(self.level_stack)
+
+        elif isinstance(pattern.action, PushAction):
             ctx = pattern.action.context
             self.push_context(ctx)
-            if ctx.meta_scope is not None:
-                scopes.append(ctx.meta_scope)
+            if ctx.meta_scope is not None and not self.current_level.flat:
+                tail.append(ctx.meta_scope)
 
         elif isinstance(pattern.action, SetAction):
             ctx = pattern.action.context
             self.set_context(ctx)
-            scopes = self.current_scopes()
+            depth = len(self.level_stack) - 1
+            tail.extend(self.current_level.scopes)
 
         elif isinstance(pattern.action, PopAction):
             # exclude meta_scope of current level
-            scopes = self.current_scopes(with_meta_scope=False)
+            tail.extend(self.current_level.content_scopes)
             self.pop_context()
+            depth = len(self.level_stack)
 
         # pattern scope
         if pattern.scope is not None:
-            scopes.append(pattern.scope)
+            tail.append(pattern.scope)
 
         # execute captures
         if pattern.captures is None:
-            token = ParseResult.Token(snippet[match.start():], scopes.copy())
-            result.tokens.append(token)
-            return result
+            emit(snippet[match.start() :], depth, tail)
+            return
 
         pos = match.start()
         for group_no in sorted(pattern.captures.keys()):
@@ -208,32 +590,147 @@ class ParseState(object):
             if start == end:  # skip empty group
                 continue
             if start > pos:  # 非分组文本
-                text = snippet[pos:start]
-                token = ParseResult.Token(text, scopes.copy())
-                result.tokens.append(token)
+                emit(snippet[pos:start], depth, tail)
 
             # 分组文本
-            text = snippet[start:end]
             addition_scope = pattern.captures[group_no]
-            token = ParseResult.Token(text, scopes + [addition_scope])
-            result.tokens.append(token)
+            emit(snippet[start:end], depth, tail + [addition_scope])
 
             pos = end
 
         text = snippet[pos:]  # 捕获剩下的文本
         if len(text) > 0:
-            token = ParseResult.Token(text, scopes)
-            result.tokens.append(token)
+            emit(text, depth, tail)
 
-        return result
+    def parse_line(
+        self, line: str, *, coalesce=False, offsets: "Optional[str]" = None
+    ) -> ParseResult:
+        """
+        :param coalesce: merge adjacent tokens with equal scopes
+        :param offsets: set `start` and `end` of tokens, counted in
+            `hlkit.offsets.CODEPOINT`, `UTF16` or `UTF8` units
+        """
+        final_result = self._parse_line_cached(line, coalesce=coalesce)
+
+        if offsets is not None:
+            index = OffsetIndex(line, offsets)
+            pos = 0
+            for token in final_result.tokens:
+                token.start = index[pos]
+                pos += len(token.text)
+                token.end = index[pos]
+
+        return final_result
+
+    def _parse_line_cached(self, line: str, *, coalesce=False) -> ParseResult:
+        # the fingerprint of an overflowed stack grows with its runs
+        if self.line_cache is None or self.flat_depth > 0:
+            return self._parse_line(line, coalesce=coalesce)
+
+        # states with other limits may parse the same line differently
+        limits = (self.max_depth, self.on_overflow)
+        key = (self.fingerprint, line, coalesce, limits)
+        cached = self.line_cache.get(key)
+        if cached is not None:
+            tokens, end_levels, end_runs = cached
+            self.level_stack = list(end_levels)
+            self._flat_runs = [list(run) for run in end_runs]
+            self.flat_depth = sum(n for _, n in end_runs)
+            self._event_levels = -1
+            # cached scopes are tuples, callers get lists of their own
+            return ParseResult(
+                *[ParseResult.Token(t, list(s)) for t, s in tokens]
+            )
+
+        final_result = self._parse_line(line, coalesce=coalesce)
+        tokens = tuple((t.text, tuple(t.scopes)) for t in final_result.tokens)
+        end_runs = tuple(tuple(run) for run in self._flat_runs)
+        end_state = (tokens, tuple(self.level_stack), end_runs)
+        self.line_cache.put(key, end_state)
+        return final_result
 
-    def parse_line(self, line: str) -> ParseResult:
+    def _parse_line(self, line: str, *, coalesce=False) -> ParseResult:
         final_result = ParseResult()
         pos = 0
 
+        tokens = final_result.tokens
+
+        def emit(text, depth, tail):
+            nonlocal pos
+            pos += len(text)
+            scopes = self._scopes_at(depth)
+            scopes.extend(tail)
+            if coalesce and len(tokens) > 0 and tokens[-1].scopes == scopes:
+                tokens[-1].text += text
+            else:
+                tokens.append(ParseResult.Token(text, scopes))
+
         while pos < len(line):
-            result = self.parse_next_token(line, pos)
-            final_result.extend(result.tokens)
-            pos += result.chars_count
+            self._next_token(line, pos, emit)
 
         return final_result
+
+    def parse_line_events(
+        self, line: str, *, offsets: "Optional[str]" = None
+    ) -> ScopeEvents:
+        """
+        Parse `line` into scope change events instead of tokens,
+        scopes still opened at end of line are kept for the next line.
+
+        :param offsets: unit of event offsets, see `parse_line`, code points
+            by default
+        """
+        final_result = ScopeEvents()
+        index = None if offsets is None else OffsetIndex(line, offsets)
+        pos = 0
+
+        def emit(text, depth, tail):
+            nonlocal pos
+            offset = pos if index is None else index[pos]
+            self._scope_delta(final_result, offset, depth, tail)
+            final_result.events.append((offset, ScopeEvents.TEXT, text))
+            pos += len(text)
+
+        while pos < len(line):
+            self._next_token(line, pos, emit)
+
+        return final_result
+
+    def _scope_delta(
+        self, result: ScopeEvents, offset: int, depth: int, tail: "List[str]"
+    ):
+        """
+        emit events turning `event_scopes` into the scopes of the `depth`
+        bottom levels then `tail`. Levels left untouched since the previous
+        call are skipped, so the work done follows the changes made to
+        `level_stack`, not its depth.
+        """
+        opened = self.event_scopes
+
+        depth = self._scoped_depth(depth)
+        known = min(self._event_levels, depth)
+        if known < 0:
+            base = 0
+            wanted = list(self._root_scopes)
+            known = 0
+        else:
+            base = self._scope_end(known)
+            wanted = []
+        for level in self.level_stack[known:depth]:
+            wanted.extend(level.scopes)
+        wanted.extend(tail)
+
+        common = 0
+        limit = min(len(opened) - base, len(wanted))
+        while common < limit and opened[base + common] == wanted[common]:
+            common += 1
+
+        for scope in reversed(opened[base + common :]):
+            result.events.append((offset, ScopeEvents.POP, scope))
+        del opened[base + common :]
+
+        for scope in wanted[common:]:
+            result.events.append((offset, ScopeEvents.PUSH, scope))
+            opened.append(scope)
+
+        self._event_levels = depth
@@ -0,0 +1,235 @@
+"""
+Shared pool of syntax definitions
+
+Syntaxes referenced by others (`include: scope:source.x`,
+`push: Packages/X/X.sublime-syntax`, `embed: scope:source.x`) are looked up
+here. Files are only indexed by their `scope` up front, a definition is
+loaded and linked the first time a document enters it, then shared by
+every syntax embedding it.
+"""
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+from hlkit._typing import TYPE_CHECKING
+from hlkit.syntax import LinkError, SyntaxDefinition
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Optional, Tuple
+
+# top level `scope` of a `.sublime-syntax` file, read without yaml
+SCOPE_RE = re.compile(r"""^scope:\s*["']?([^\s"'#]+)""", re.MULTILINE)
+
+# bundled syntaxes, see `assets/Packages`
+ASSETS_DIR = os.path.join(os.path.dirname(__file__), "assets")
+
+
+class GrammarPool(object):
+    # `Packages/X/X.sublime-syntax` style path -> file path
+    _paths: "Dict[str, str]"
+
+    # scope -> `Packages/...` path
+    _scopes: "Dict[str, str]"
+
+    # loaded definitions, by `Packages/...` path or by scope
+    _loaded: "Dict[str, SyntaxDefinition]"
+
+    # definitions loaded from files, least recently used first, by id
+    _recent: "OrderedDict[int, SyntaxDefinition]"
+
+    # maximum number of definitions loaded from files, `None` for no limit
+    max_loaded: "Optional[int]"
+
+    # definitions dropped to stay within `max_loaded`
+    evictions: int
+
+    # bumped whenever a syntax is added, see `index_digest`
+    generation: int
+
+    # `Packages/...` path -> (size, crc32) of indexed files
+    _checksums: "Dict[str, Tuple[int, int]]"
+
+    # `(generation, index_digest())` of the last call
+    _index_digest: "Optional[Tuple[int, str]]"
+
+    _lock: threading.RLock
+
+    def __init__(
+        self,
+        roots: "Iterable[str]" = (),
+        *,
+        max_loaded: "Optional[int]" = None
+    ):
+        """
+        :param roots: directories containing `Packages/`
+        :param max_loaded: keep at most this many definitions loaded from
+            files, least recently used ones are dropped and loaded again
+            when needed. Definitions still referenced by another loaded
+            one, by a `ParseState` or by the caller stay alive until
+            they are dropped too.
+        """
+        if max_loaded is not None and max_loaded <= 0:
+            raise ValueError("max_loaded must be positive")
+
+        self._paths = dict()
+        self._scopes = dict()
+        self._loaded = dict()
+        self._recent = OrderedDict()
+        self.max_loaded = max_loaded
+        self.evictions = 0
+        self.generation = 0
+        self._checksums = dict()
+        self._index_digest = None
+        self._lock = threading.RLock()
+
+        for root in roots:
+            self.add_root(root)
+
+    def add_root(self, root: str):
+        """ index every `.sublime-syntax` file under `root` """
+        for dirpath, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                if filename.endswith(".sublime-syntax"):
+                    path = os.path.join(dirpath, filename)
+                    self.add_file(path, os.path.relpath(path, root))
+
+    def add_file(self, path: str, package_path: "Optional[str]" = None):
+        """
+        :param package_path: path used by references, like
+            `Packages/JSON/JSON.sublime-syntax`
+        """
+        if package_path is None:
+            package_path = os.path.basename(path)
+        package_path = package_path.replace(os.sep, "/")
+
+        with open(path, "rb") as f:
+            content = f.read()
+        match = SCOPE_RE.search(content.decode("utf-8"))
+        checksum = (len(content), zlib.crc32(content))
+
+        with self._lock:
+            self._paths[package_path] = path
+            self._checksums[package_path] = checksum
+            self.generation += 1
+            if match is not None:
+                self._scopes.setdefault(match.group(1), package_path)
+
+    def add(self, syndef: SyntaxDefinition):
+        """
+        add an already loaded definition, found by its scope, it is never
+        dropped by `max_loaded`
+        """
+        with self._lock:
+            self._loaded[syndef.scope] = syndef
+            self.generation += 1
+
+    def index_digest(self) -> str:
+        """
+        sha1 of the syntaxes known by the pool: checksums of the indexed
+        files, definitions added with `add`. Nothing is loaded, it is
+        memoized until `generation` changes.
+        """
+        with self._lock:
+            memo = self._index_digest
+            if memo is not None and memo[0] == self.generation:
+                return memo[1]
+
+            import hashlib
+
+            added = sorted(
+                (str(scope), syndef._own_digest())
+                for scope, syndef in self._loaded.items()
+                if id(syndef) not in self._recent
+            )
+            files = sorted(self._checksums.items())
+            described = repr((files, added)).encode()
+            digest = hashlib.sha1(described).hexdigest()
+            self._index_digest = (self.generation, digest)
+            return digest
+
+    @property
+    def scopes(self) -> "List[str]":
+        """ scopes of all known syntaxes """
+        return sorted(set(self._scopes) | set(self._loaded))
+
+    @property
+    def loaded(self) -> "List[SyntaxDefinition]":
+        """ loaded definitions, each once """
+        with self._lock:
+            unique = dict((id(s), s) for s in self._loaded.values())
+        return list(unique.values())
+
+    def get_by_scope(self, scope: str) -> SyntaxDefinition:
+        with self._lock:
+            syndef = self._loaded.get(scope)
+            if syndef is not None:
+                self._touch(syndef)
+                return syndef
+
+            package_path = self._scopes.get(scope)
+            if package_path is None:
+                raise LinkError("unknown syntax: scope:%s" % scope)
+            return self.get_by_path(package_path)
+
+    def get_by_path(self, package_path: str) -> SyntaxDefinition:
+        with self._lock:
+            syndef = self._loaded.get(package_path)
+            if syndef is not None:
+                self._touch(syndef)
+                return syndef
+
+            path = self._paths.get(package_path)
+            if path is None:
+                raise LinkError("unknown syntax: %s" % package_path)
+
+            syndef = SyntaxDefinition.load_file(path, pool=self)
+            self._loaded[package_path] = syndef
+            if syndef.scope is not None:
+                self._loaded.setdefault(syndef.scope, syndef)
+
+            self._recent[id(syndef)] = syndef
+            if self.max_loaded is not None:
+                while len(self._recent) > self.max_loaded:
+                    _, evicted = self._recent.popitem(last=False)
+                    self._evict(evicted)
+            return syndef
+
+    def lookup(
+        self, kind: str, target: str
+    ) -> "Optional[SyntaxDefinition]":
+        """
+        definition by `"scope"` or `"file"` (see `split_reference`), `None`
+        if not known by the pool
+        """
+        with self._lock:
+            if kind == "scope":
+                if target not in self._loaded and target not in self._scopes:
+                    return None
+                return self.get_by_scope(target)
+            if target not in self._loaded and target not in self._paths:
+                return None
+            return self.get_by_path(target)
+
+    def _touch(self, syndef: SyntaxDefinition):
+        if id(syndef) in self._recent:
+            self._recent.move_to_end(id(syndef))
+
+    def _evict(self, syndef: SyntaxDefinition):
+        for key in [k for k, v in self._loaded.items() if v is syndef]:
+            del self._loaded[key]
+        self.evictions += 1
+
+
+_default_pool: "Optional[GrammarPool]" = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool() -> GrammarPool:
+    """ process-wide pool, with the bundled syntaxes """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = GrammarPool([ASSETS_DIR])
+    return _default_pool
@@ -0,0 +1,272 @@
+"""
+Static analysis of regexes, finding what a match has to start with.
+
+`analyze` extracts the required leading literal (`/\\*`, `---`, ...) or the
+set of possible first characters (`true|false|null`) of a regex, so the
+parser can rule a pattern out with `str.find` before running the regex.
+"""
+import re
+
+from hlkit._typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import FrozenSet, List, Optional, Tuple
+
+# characters with a special meaning outside of character classes
+SPECIAL_CHARS = set(".^$*+?{}[]\\|()")
+
+# escapes standing for a single literal character
+CHAR_ESCAPES = {"n": "\n", "t": "\t"}
+
+# zero-width escapes allowed before the leading literal
+ZERO_WIDTH_ESCAPES = set("bBAG")
+
+# scanning for more first characters than this is not worth it
+MAX_FIRST_CHARS = 8
+
+# inline flags such as `(?i)`, `(?x)` or `(?i:...)` change what a
+# character means, regexes using them are not analyzed
+INLINE_FLAGS_RE = re.compile(r"\(\?[a-zA-Z\-]+[:)]")
+
+# `{n}`, `{n,}` or `{n,m}` with n >= 1
+REPEAT_RE = re.compile(r"\{0*[1-9]\d*(,\d*)?\}")
+
+
+class Prefilter(object):
+    """ What every match of a regex starts with """
+
+    # required leading literal, may be empty
+    literal: str
+
+    # possible first characters of a match
+    first_chars: "FrozenSet[str]"
+
+    def __init__(self, literal: str, first_chars: "FrozenSet[str]"):
+        self.literal = literal
+        self.first_chars = first_chars
+
+    def __repr__(self) -> str:
+        if self.literal:
+            return "<Prefilter literal=%r>" % self.literal
+        return "<Prefilter first_chars=%r>" % "".join(sorted(self.first_chars))
+
+    def find(self, string: str, pos: int = 0) -> int:
+        """
+        Lowest index where a match may start, `-1` if it can not match.
+        """
+        if self.literal:
+            return string.find(self.literal, pos)
+
+        best = -1
+        for char in self.first_chars:
+            index = string.find(char, pos)
+            if index >= 0 and (best < 0 or index < best):
+                best = index
+        return best
+
+
+def analyze(regex: str) -> "Optional[Prefilter]":
+    """ Get `Prefilter` of expanded `regex`, `None` when nothing is known """
+    if INLINE_FLAGS_RE.search(regex) is not None:
+        return None
+
+    literal, first_chars = _leading(regex)
+    if first_chars is None:
+        return None
+    if not literal and len(first_chars) > MAX_FIRST_CHARS:
+        return None
+    return Prefilter(literal, first_chars)
+
+
+def _leading(regex: str) -> "Tuple[str, Optional[FrozenSet[str]]]":
+    """ leading literal and first characters of `regex` """
+    alternatives = _split_alternatives(regex)
+    if alternatives is None:
+        return "", None
+    if len(alternatives) == 1:
+        return _leading_sequence(regex)
+
+    first_chars = set()
+    for alternative in alternatives:
+        _, alt_chars = _leading_sequence(alternative)
+        if alt_chars is None:
+            return "", None
+        first_chars |= alt_chars
+    return "", frozenset(first_chars)
+
+
+def _leading_sequence(regex: str) -> "Tuple[str, Optional[FrozenSet[str]]]":
+    """ same as `_leading`, for a regex without top level alternation """
+    literal: "List[str]" = []
+    i = 0
+
+    while i < len(regex):
+        c = regex[i]
+
+        if c == "^" and not literal:
+            i += 1
+            continue
+
+        if c == "\\":
+            if i + 1 >= len(regex):
+                break
+            escaped = regex[i + 1]
+            if escaped in ZERO_WIDTH_ESCAPES and not literal:
+                i += 2
+                continue
+            if escaped in CHAR_ESCAPES:
+                char = CHAR_ESCAPES[escaped]
+            elif not escaped.isalnum():
+                char = escaped
+            else:
+                break
+            next_i = i + 2
+        elif c == "(":
+            if literal:
+                break
+            return _leading_group(regex, i)
+        elif c == "[":
+            if literal:
+                break
+            return "", _leading_class(regex, i)
+        elif c in SPECIAL_CHARS:
+            break
+        else:
+            char = c
+            next_i = i + 1
+
+        if _is_optional(regex, next_i):
+            break
+        literal.append(char)
+        if next_i < len(regex) and regex[next_i] in "+{":
+            break  # repeated, the next char is unknown
+        i = next_i
+
+    if not literal:
+        return "", None
+    return "".join(literal), frozenset(literal[0])
+
+
+def _leading_group(
+    regex: str, start: int
+) -> "Tuple[str, Optional[FrozenSet[str]]]":
+    """ `_leading` of a regex starting with the group at `start` """
+    end = _find_group_end(regex, start)
+    if end < 0:
+        return "", None
+
+    if regex.startswith("(?:", start) or regex.startswith("(?=", start):
+        inner = regex[start + 3 : end]
+    elif regex.startswith("(?", start):
+        return "", None  # lookbehind, negative lookahead, named group...
+    else:
+        inner = regex[start + 1 : end]
+
+    if _is_optional(regex, end + 1):
+        return "", None
+
+    return _leading(inner)
+
+
+def _leading_class(regex: str, start: int) -> "Optional[FrozenSet[str]]":
+    """ chars of the simple class at `start`, like `[,;]` (no ranges) """
+    chars = set()
+    i = start + 1
+
+    while i < len(regex):
+        c = regex[i]
+        if c == "]" and i > start + 1:
+            break
+        if c == "\\":
+            if i + 1 >= len(regex) or regex[i + 1].isalnum():
+                return None
+            chars.add(regex[i + 1])
+            i += 2
+        elif c in "^-[" or (c == "&" and regex.startswith("&&", i)):
+            return None  # negated, range or nested sets
+        else:
+            chars.add(c)
+            i += 1
+    else:
+        return None  # unclosed
+
+    if not chars or _is_optional(regex, i + 1):
+        return None
+    return frozenset(chars)
+
+
+def _is_optional(regex: str, pos: int) -> bool:
+    """ is the atom before `pos` quantified, possibly zero times """
+    if pos >= len(regex):
+        return False
+    if regex[pos] == "{":
+        return REPEAT_RE.match(regex, pos) is None
+    return regex[pos] in "?*"
+
+
+def _split_alternatives(regex: str) -> "Optional[List[str]]":
+    """ split `regex` at top level `|`, `None` if unbalanced """
+    alternatives = []
+    depth = 0
+    class_depth = 0
+    last = 0
+    i = 0
+
+    while i < len(regex):
+        c = regex[i]
+        if c == "\\":
+            i += 2
+            continue
+
+        if class_depth > 0:
+            if c == "[":
+                class_depth += 1
+            elif c == "]" and regex[i - 1] not in "[^":
+                class_depth -= 1
+        elif c == "[":
+            class_depth += 1
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif c == "|" and depth == 0:
+            alternatives.append(regex[last:i])
+            last = i + 1
+        i += 1
+
+    if depth != 0 or class_depth != 0:
+        return None
+    alternatives.append(regex[last:])
+    return alternatives
+
+
+def _find_group_end(regex: str, start: int) -> int:
+    """ index of `)` closing the group opened at `start`, or `-1` """
+    depth = 0
+    class_depth = 0
+    i = start
+
+    while i < len(regex):
+        c = regex[i]
+        if c == "\\":
+            i += 2
+            continue
+
+        if class_depth > 0:
+            if c == "[":
+                class_depth += 1
+            elif c == "]" and regex[i - 1] not in "[^":
+                class_depth -= 1
+        elif c == "[":
+            class_depth += 1
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+
+    return -1
@@ -1,7 +1,16 @@
+import copy
+import itertools
 import re
 import weakref
 from abc import ABCMeta
-from typing import Dict, List, Optional, Union
+
+from hlkit._typing import TYPE_CHECKING
+from hlkit.prefilter import Prefilter, analyze
+
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Match, Optional, Pattern, Tuple, Union
+
+    from hlkit.pool import GrammarPool
 
 
 def obj_proxy(obj):
@@ -11,6 +20,29 @@ def obj_proxy(obj):
         return weakref.proxy(obj)
 
 
+class LinkError(ValueError):
+    """ Unresolvable reference found while linking a syntax definition """
+
+
+# process-wide, so contexts of different syntaxes never share an id
+_link_ids = itertools.count()
+
+
+def split_reference(ref: str) -> "Optional[Tuple[str, str, str]]":
+    """
+    `(kind, target, context name)` of a reference to another syntax,
+    `None` for a context of the same syntax:
+      - `scope:source.x`, `scope:source.x#ctx` -> `("scope", "source.x", ...)`
+      - `Packages/X/X.sublime-syntax#ctx` -> `("file", "Packages/...", ...)`
+    """
+    target, _, ctx_name = ref.partition("#")
+    if target.startswith("scope:"):
+        return "scope", target[len("scope:") :], ctx_name or "main"
+    if target.endswith(".sublime-syntax"):
+        return "file", target, ctx_name or "main"
+    return None
+
+
 class MatchRegex(object):
     """
     Expandable regex
@@ -23,9 +55,21 @@ class MatchRegex(object):
 
     _regex: str
 
+    # expanded regex, filled by `SyntaxDefinition.link`
+    _expanded: "Optional[str]"
+
+    # what every match starts with, filled by `SyntaxDefinition.link`
+    prefilter: "Optional[Prefilter]"
+
+    # compiled on first search
+    _compiled: "Optional[Pattern]"
+
     def __init__(self, syndef, regex: str):
         self.syndef = obj_proxy(syndef)
         self._regex = regex
+        self._expanded = None
+        self.prefilter = None
+        self._compiled = None
 
     @classmethod
     def create(cls, syndef, regex):
@@ -35,26 +79,47 @@ class MatchRegex(object):
 
     def __str__(self) -> str:
         """ Computed regex string """
-        return self._expand(self._regex)
+        if self._expanded is None:
+            self._expanded = self.syndef.expand_variables(self._regex)
+        return self._expanded
 
     EXPAND_RE = re.compile(r"{{([A-Za-z0-9_]+)}}")
 
-    def _expand(self, regex: str) -> str:
-        """ variables expanded (recursive) """
-        match = re.search(self.EXPAND_RE, regex)
-
-        while match is not None:  # for multiple variables expansion
-            if match is None:
-                return regex
+    # `\1` or `\k<name>`, other escapes are skipped whole
+    BACKREF_RE = re.compile(r"\\(?:([1-9])|k<(\w+)>|.)")
 
-            var_name = match.group(1)
-            var_value = self.syndef.variables[var_name]
-            var_value = self._expand(var_value)  # variable expand
+    def search(
+        self, string: str, pos: int = 0, endpos: "Optional[int]" = None
+    ) -> "Optional[Match]":
+        if self._compiled is None:
+            self._compiled = re.compile(str(self))
+        if endpos is None:
+            return self._compiled.search(string, pos)
+        return self._compiled.search(string, pos, endpos)
 
-            regex = regex.replace("{{%s}}" % var_name, var_value)
-
-            match = re.search(self.EXPAND_RE, regex)
+    @property
+    def has_backrefs(self) -> bool:
+        """ does the regex refer to groups of another match (`escape`) """
+        for m in self.BACKREF_RE.finditer(str(self)):
+            if m.group(1) is not None or m.group(2) is not None:
+                return True
+        return False
+
+    def with_backrefs(self, match: "Match") -> "MatchRegex":
+        """ a copy with back references replaced by the groups of `match` """
+
+        def substitute(m):
+            if m.group(1) is not None:
+                group = match.group(int(m.group(1)))
+            elif m.group(2) is not None:
+                group = match.group(m.group(2))
+            else:
+                return m.group(0)
+            return re.escape(group or "")
 
+        regex = MatchRegex(self.syndef, self._regex)
+        regex._expanded = self.BACKREF_RE.sub(substitute, str(self))
+        regex.prefilter = analyze(regex._expanded)
         return regex
 
 
@@ -71,25 +136,34 @@ class IntoContextAction(MatchAction):
     # name ref context
     _ctxname: str
 
+    # resolved context, filled by `link` (other syntax: on first use)
+    _context: "Optional[SyntaxContext]"  # ProxyType
+
     def __init__(self, pattern, synctx):
         self.pat_ref = obj_proxy(pattern)
         if isinstance(synctx, str):
             self._ctxname = synctx
+            self._context = None
         elif isinstance(synctx, SyntaxContext):
             self._synctx = synctx
+            self._context = obj_proxy(synctx)
         else:
             raise ValueError
 
+    def link(self):
+        """ resolve the name ref context """
+        ctx_name = getattr(self, "_ctxname", None)
+        if isinstance(ctx_name, str) and split_reference(ctx_name) is None:
+            syndef = self.pat_ref.synctx.syndef
+            self._context = obj_proxy(syndef.resolve(ctx_name))
+
     @property
     def context(self) -> "SyntaxContext":
         """ get ref synctx """
-        synctx = getattr(self, "_synctx", None)
-        if isinstance(synctx, SyntaxContext):
-            return synctx
-
-        ctx_name = getattr(self, "_ctxname", None)
-        if isinstance(ctx_name, str):
-            return obj_proxy(self.pat_ref.synctx.syndef[ctx_name])
+        if self._context is None:  # other syntax, loaded on first use
+            syndef = self.pat_ref.synctx.syndef
+            self._context = obj_proxy(syndef.resolve(self._ctxname))
+        return self._context
 
 
 class PushAction(IntoContextAction):
@@ -104,6 +178,20 @@ class PopAction(MatchAction):
     pass
 
 
+class EmbedAction(IntoContextAction):
+    """ push another syntax, until `escape` matches """
+
+    # injected with the highest priority into the embedded contexts
+    escape: "MatchPattern"
+
+    # scope of the embedded text
+    embed_scope: "Optional[str]"
+
+
+class EscapeAction(MatchAction):
+    """ pop the embedded syntax, action of `EmbedAction.escape` """
+
+
 class SyntaxPattern(metaclass=ABCMeta):
     synctx: "SyntaxContext"  # ProxyType
 
@@ -114,15 +202,31 @@ class SyntaxPattern(metaclass=ABCMeta):
 class IncludePattern(SyntaxPattern):
     name: str
 
+    # resolved context, filled by `link` (other syntax: on first use)
+    _context: "Optional[SyntaxContext]"  # ProxyType
+
     @classmethod
-    def from_dict(cls, synctx, data: Dict):
+    def from_dict(cls, synctx, data: "Dict"):
         p = cls(synctx)
         p.name = data.get("include")
+        p._context = None
         return p
 
+    @property
+    def is_external(self) -> bool:
+        """ is the included context defined by another syntax """
+        return split_reference(self.name) is not None
+
+    def link(self):
+        """ resolve the included context """
+        if not self.is_external:
+            self._context = obj_proxy(self.synctx.syndef.resolve(self.name))
+
     @property
     def context(self) -> "SyntaxContext":
-        return self.synctx.syndef[self.name]
+        if self._context is None:  # other syntax, loaded on first use
+            self._context = obj_proxy(self.synctx.syndef.resolve(self.name))
+        return self._context
 
 
 class MatchPattern(SyntaxPattern):
@@ -130,16 +234,16 @@ class MatchPattern(SyntaxPattern):
     match: MatchRegex
 
     # 为匹配的文本附加的 scope
-    scope: Optional[str]
+    scope: "Optional[str]"
 
     # `match` 的正则捕获分组，为不同分组赋予不同的 scope
-    captures: Optional[Dict[int, str]]
+    captures: "Optional[Dict[int, str]]"
 
     # 匹配到该 pattern 时的动作
-    action: Optional[MatchAction]
+    action: "Optional[MatchAction]"
 
     @classmethod
-    def from_dict(cls, synctx, data: Dict) -> "MatchPattern":
+    def from_dict(cls, synctx, data: "Dict") -> "MatchPattern":
         p = cls(synctx)
 
         p.match = MatchRegex.create(synctx.syndef, data["match"])
@@ -149,7 +253,18 @@ class MatchPattern(SyntaxPattern):
 
         return p
 
-    def setup_action(self, data: Dict):
+    def with_backrefs(self, match: "Match") -> "MatchPattern":
+        """
+        the pattern, with back references of its regex replaced by the groups
+        of `match` (`escape` refers to the `embed` match)
+        """
+        if not self.match.has_backrefs:
+            return self
+        p = copy.copy(self)
+        p.match = self.match.with_backrefs(match)
+        return p
+
+    def setup_action(self, data: "Dict"):
         """
         setup action object
         """
@@ -170,6 +285,20 @@ class MatchPattern(SyntaxPattern):
         elif isinstance(set_data, list):
             self.action = SetAction(self, get_nested_ctx(set_data))
 
+        embed_data = data.get("embed")
+        if isinstance(embed_data, str):
+            if "escape" not in data:
+                raise LinkError("embed without escape: %s" % embed_data)
+            self.action = EmbedAction(self, embed_data)
+            self.action.embed_scope = data.get("embed_scope")
+            escape_data = {
+                "match": data["escape"],
+                "captures": data.get("escape_captures"),
+            }
+            escape = MatchPattern.from_dict(self.synctx, escape_data)
+            escape.action = EscapeAction()
+            self.action.escape = escape
+
         if "pop" in data.keys() and data.get("pop") is True:
             self.action = PopAction()
 
@@ -177,20 +306,31 @@ class MatchPattern(SyntaxPattern):
 class SyntaxContext(object):
     syndef: "SyntaxDefinition"  # ProxyType
 
-    meta_scope: Optional[str]
-    meta_content_scope: Optional[str]
+    # context name, `None` for nested (anonymous) contexts
+    name: "Optional[str]"
+
+    meta_scope: "Optional[str]"
+    meta_content_scope: "Optional[str]"
     meta_include_prototype: bool
-    clear_scopes: Union[int, bool]
-    patterns: List[SyntaxPattern]
+    clear_scopes: "Union[int, bool]"
+    patterns: "List[SyntaxPattern]"
+
+    # flatten `MatchPattern` (prototype included), filled by `link`,
+    # `None` until first use if another syntax is included
+    _matches: "Optional[List[MatchPattern]]"
+
+    # process-wide unique id, filled by `link`
+    link_id: int
 
     def __init__(self, syndef: "SyntaxDefinition"):
         self.syndef = obj_proxy(syndef)
 
     @classmethod
-    def from_dict(cls, syndef, data: List[Dict]):
+    def from_dict(cls, syndef, data: "List[Dict]"):
         ctx = cls(syndef)
 
         # set defaults
+        ctx.name = None
         ctx.meta_scope = None
         ctx.meta_content_scope = None
         ctx.meta_include_prototype = True
@@ -221,42 +361,223 @@ class SyntaxContext(object):
     def __getitem__(self, index: int):
         return self.patterns[index]
 
+    def __repr__(self) -> str:
+        return "<SyntaxContext %s>" % (self.name or "(anonymous)")
+
+    @property
+    def matches(self) -> "List[MatchPattern]":
+        if self._matches is None:
+            self._matches = self.syndef.context_matches(self)
+        return self._matches
+
+    def nested_contexts(self) -> "List[SyntaxContext]":
+        """ anonymous contexts defined in `push` / `set` of this context """
+        result = []
+        for pattern in self.patterns:
+            action = getattr(pattern, "action", None)
+            synctx = getattr(action, "_synctx", None)
+            if synctx is not None:
+                result.append(synctx)
+                result.extend(synctx.nested_contexts())
+        return result
+
 
 class SyntaxDefinition(object):
     name: str
-    file_extensions: List[str]
-    first_line_match: Optional[MatchRegex]
+    file_extensions: "List[str]"
+    first_line_match: "Optional[MatchRegex]"
+
+    scope: "Optional[str]"
 
-    scope: Optional[str]
+    # `(pool generation, digest)`, see `digest`
+    _digest: "Optional[Tuple[Optional[int], str]]"
 
-    variables: Dict[str, str]
-    contexts: List[SyntaxContext]
+    # sha1 of the definition alone, see `_own_digest`
+    _own_digest_value: "Optional[str]"
+
+    # memoized `external_references`
+    _references: "Optional[List[Tuple[str, str]]]"
+
+    variables: "Dict[str, str]"
+    contexts: "List[SyntaxContext]"
+
+    # memoized `variables` with all references expanded
+    _expanded_variables: "Dict[str, str]"
 
     # mapping from context name to index
-    _context_names: Dict[str, int]
+    _context_names: "Dict[str, int]"
+
+    # resolves references to other syntaxes, `None` for the default pool
+    pool: "Optional[GrammarPool]"
+
+    # memoized `_flatten` of named contexts
+    _flattened: "Dict[str, List[MatchPattern]]"
+
+    # other syntaxes referenced so far, by `(kind, target)`, kept alive here
+    # since contexts only hold proxies into them
+    _externals: "Dict[Tuple[str, str], SyntaxDefinition]"
+
+    # references to syntaxes the pool does not know, e.g.
+    # `scope:text.html.basic`, they are parsed as empty contexts
+    missing_syntaxes: "List[str]"
+
+    # stand-in for contexts of missing syntaxes, see `resolve`
+    _missing_context: "Optional[SyntaxContext]"
 
     @property
     def ctx_main(self) -> SyntaxContext:
         return obj_proxy(self["main"])
 
     @property
-    def prototype_patterns(self) -> List[SyntaxPattern]:
+    def prototype_patterns(self) -> "List[SyntaxPattern]":
         try:
             prototype_ctx = self["prototype"]
         except KeyError:  # no prototype
             return []
         return prototype_ctx.patterns
 
+    @property
+    def digest(self) -> str:
+        """
+        sha1 of everything affecting the highlighting, so it changes with
+        the definition (version) but not across processes. If it refers to
+        other syntaxes, it also covers the syntaxes known by its pool, see
+        `GrammarPool.index_digest`, without loading any of them.
+        """
+        pool = None
+        if len(self.external_references()) > 0:
+            pool = self.pool
+            if pool is None:
+                from hlkit.pool import default_pool
+
+                pool = default_pool()
+
+        generation = None if pool is None else pool.generation
+        if self._digest is not None and self._digest[0] == generation:
+            return self._digest[1]
+
+        import hashlib  # only needed by caches, imported on first use
+
+        index = None if pool is None else pool.index_digest()
+        described = repr((self._own_digest(), index)).encode()
+        digest = hashlib.sha1(described).hexdigest()
+        self._digest = (generation, digest)
+        return digest
+
+    def _own_digest(self) -> str:
+        """ sha1 of the definition alone, references are left as names """
+        if self._own_digest_value is None:
+            import hashlib
+
+            described = repr(self._describe()).encode()
+            self._own_digest_value = hashlib.sha1(described).hexdigest()
+        return self._own_digest_value
+
+    def external_references(self) -> "List[Tuple[str, str]]":
+        """ `(kind, target)` of the other syntaxes referenced, in order """
+        if self._references is not None:
+            return self._references
+
+        result = []
+        for ctx in self.all_contexts():
+            for pattern in ctx.patterns:
+                if isinstance(pattern, IncludePattern):
+                    name = pattern.name
+                else:
+                    name = getattr(pattern.action, "_ctxname", None)
+                if not isinstance(name, str):
+                    continue
+
+                ref = split_reference(name)
+                if ref is None or (ref[0] == "scope" and ref[1] == self.scope):
+                    continue
+                if ref[:2] not in result:
+                    result.append(ref[:2])
+        self._references = result
+        return result
+
+    def _describe(self) -> "Any":
+        """ nested tuples describing the definition, for `digest` """
+
+        def describe_ctx(ctx: SyntaxContext):
+            return (
+                ctx.name,
+                ctx.meta_scope,
+                ctx.meta_content_scope,
+                ctx.meta_include_prototype,
+                ctx.clear_scopes,
+                tuple(map(describe_pattern, ctx.patterns)),
+            )
+
+        def describe_pattern(pattern: SyntaxPattern):
+            if isinstance(pattern, IncludePattern):
+                return ("include", pattern.name)
+
+            action = pattern.action
+            if isinstance(action, IntoContextAction):
+                target = getattr(action, "_synctx", None)
+                if target is None:
+                    target = action._ctxname
+                else:
+                    target = describe_ctx(target)
+                action = (type(action).__name__, target)
+                if isinstance(pattern.action, EmbedAction):
+                    escape = describe_pattern(pattern.action.escape)
+                    action += (escape, pattern.action.embed_scope)
+            elif action is not None:
+                action = type(action).__name__
+
+            captures = pattern.captures or {}
+            return (
+                "match",
+                str(pattern.match),
+                pattern.scope,
+                tuple(sorted(captures.items())),
+                action,
+            )
+
+        return (
+            self.name,
+            self.scope,
+            self.file_extensions,
+            self.first_line_match and str(self.first_line_match),
+            tuple(map(describe_ctx, self.contexts)),
+        )
+
+    @classmethod
+    def load_file(cls, path, *, pool=None) -> "SyntaxDefinition":
+        """ load a `.sublime-syntax` file, `yaml` is imported on first use """
+        import yaml
+
+        # libyaml is ~10x faster than the pure python loader
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        with open(path, encoding="utf-8") as f:
+            data = yaml.load(f, loader)
+        return cls.load(data, pool=pool)
+
     @classmethod
-    def load(cls, data: Dict):
+    def load(cls, data: "Dict", *, pool: "Optional[GrammarPool]" = None):
+        """
+        :param pool: resolves references to other syntaxes, the process-wide
+            default pool if `None`
+        """
         obj = cls()
+        obj.pool = pool
+        obj._externals = dict()
+        obj.missing_syntaxes = list()
+        obj._missing_context = None
 
         # TODO: validate data type
         obj.name = data.get("name")
         obj.file_extensions = data.get("file_extensions")
         obj.variables = data.get("variables", dict())
+        obj._expanded_variables = dict()
         obj.scope = data.get("scope")
 
+        obj._digest = None
+        obj._own_digest_value = None
+        obj._references = None
+
         obj.first_line_match = MatchRegex.create(
             obj,
             data.get("first_line_match"),
@@ -270,8 +591,12 @@ class SyntaxDefinition(object):
 
         # import contexts
         for ctx_name, ctx_data in data.get("contexts", {}).items():
-            ctx = SyntaxContext.from_dict(obj, ctx_data)
+            try:
+                ctx = SyntaxContext.from_dict(obj, ctx_data)
+            except LinkError as e:
+                raise LinkError("%s (in %s)" % (e, ctx_name)) from None
 
+            ctx.name = ctx_name
             if ctx_name == "prototype":
                 ctx.meta_include_prototype = False
 
@@ -279,8 +604,207 @@ class SyntaxDefinition(object):
             ctx_index = len(obj.contexts) - 1
             obj._context_names[ctx_name] = ctx_index
 
+        obj.link()
+
         return obj
 
     def __getitem__(self, key: str) -> SyntaxContext:
         index = self._context_names[key]
         return self.contexts[index]
+
+    def resolve(self, key: str) -> SyntaxContext:
+        """
+        same as `self[key]`, but raise `LinkError` for unknown context,
+        contexts of other syntaxes (`scope:source.x#ctx`) are looked up in
+        `pool`. A syntax missing from the pool resolves to an empty
+        context, so that an embed only waits for its escape.
+        """
+        external = split_reference(key)
+        if external is not None:
+            kind, target, key = external
+            syndef = self.external_syntax(kind, target)
+            if syndef is None:
+                return self.missing_context()
+            return syndef.resolve(key)
+
+        try:
+            return self[key]
+        except KeyError:
+            raise LinkError("undefined context: %s" % key) from None
+
+    def external_syntax(
+        self, kind: str, target: str
+    ) -> "Optional[SyntaxDefinition]":
+        """
+        other syntax, by `"scope"` or `"file"`, see `split_reference`,
+        `None` if the pool does not know it
+        """
+        if kind == "scope" and target == self.scope:
+            return self
+
+        syndef = self._externals.get((kind, target))
+        if syndef is not None:
+            return syndef
+
+        pool = self.pool
+        if pool is None:
+            from hlkit.pool import default_pool  # only needed by embeds
+
+            pool = default_pool()
+        syndef = pool.lookup(kind, target)
+        if syndef is None:
+            # not memoized, it may be added to the pool later
+            reference = target if kind == "file" else "scope:" + target
+            if reference not in self.missing_syntaxes:
+                self.missing_syntaxes.append(reference)
+            return None
+
+        # still alive if the pool evicts it, see `GrammarPool.max_loaded`
+        self._externals[(kind, target)] = syndef
+        return syndef
+
+    def missing_context(self) -> SyntaxContext:
+        """ empty context, stands for the contexts of missing syntaxes """
+        if self._missing_context is None:
+            ctx = SyntaxContext.from_dict(self, [])
+            ctx.meta_include_prototype = False
+            ctx._matches = []
+            ctx.link_id = next(_link_ids)
+            self._missing_context = ctx
+        return self._missing_context
+
+    def expand_variables(self, regex: str) -> str:
+        """ expand `{{var}}` references of `regex` in a single pass """
+        return self._expand(regex, [])
+
+    def _expand(self, regex: str, var_stack: "List[str]") -> str:
+        def replace(match):
+            return self._expand_variable(match.group(1), var_stack)
+
+        return MatchRegex.EXPAND_RE.sub(replace, regex)
+
+    def _expand_variable(self, var_name: str, var_stack: "List[str]") -> str:
+        """ expanded value of variable `var_name`, computed only once """
+        expanded = self._expanded_variables.get(var_name)
+        if expanded is not None:
+            return expanded
+
+        if var_name in var_stack:
+            chain = " -> ".join(var_stack + [var_name])
+            raise LinkError("cyclic variable: %s" % chain)
+        try:
+            var_value = self.variables[var_name]
+        except KeyError:
+            raise LinkError("undefined variable: %s" % var_name) from None
+
+        var_stack.append(var_name)
+        expanded = self._expand(var_value, var_stack)
+        var_stack.pop()
+
+        self._expanded_variables[var_name] = expanded
+        return expanded
+
+    def all_contexts(self) -> "List[SyntaxContext]":
+        """ named contexts followed by all nested contexts """
+        result = list(self.contexts)
+        for ctx in self.contexts:
+            result.extend(ctx.nested_contexts())
+        return result
+
+    def link(self):
+        """
+        Resolve all references ahead of parsing:
+          - expand variables of every regex
+          - resolve context names of `push` / `set` / `include`
+          - flatten includes (with prototype) into `SyntaxContext.matches`
+
+        References to other syntaxes are left to the first use, so
+        embedded syntaxes are only loaded when a document enters them.
+        """
+        # every variable must be expandable, even if not referenced
+        for var_name in self.variables.keys():
+            self._expand_variable(var_name, [])
+        if self.first_line_match is not None:
+            str(self.first_line_match)  # expand and cache
+
+        contexts = self.all_contexts()
+        for ctx in contexts:
+            ctx.link_id = next(_link_ids)
+            for pattern in ctx.patterns:
+                if isinstance(pattern, IncludePattern):
+                    pattern.link()
+                elif isinstance(pattern, MatchPattern):
+                    pattern.match.prefilter = analyze(str(pattern.match))
+                    if isinstance(pattern.action, EmbedAction):
+                        escape = pattern.action.escape.match
+                        escape.prefilter = analyze(str(escape))
+                    if isinstance(pattern.action, IntoContextAction):
+                        pattern.action.link()
+
+        self._flattened = dict()
+        for ctx in contexts:
+            ctx._matches = self.context_matches(ctx, resolve_external=False)
+
+    def context_matches(
+        self, ctx: SyntaxContext, *, resolve_external=True
+    ) -> "Optional[List[MatchPattern]]":
+        """
+        flatten `MatchPattern` of `ctx`, prototype included
+
+        :param resolve_external: load other syntaxes included by `ctx`,
+            otherwise return `None` for such contexts
+        """
+        matches = self._flatten(ctx, [], resolve_external)
+        if matches is None or ctx.meta_include_prototype is not True:
+            return matches
+        if "prototype" not in self._context_names:
+            return matches
+
+        proto_matches = self._flatten(self["prototype"], [], resolve_external)
+        if proto_matches is None:
+            return None
+        return proto_matches + matches
+
+    def _flatten(
+        self,
+        ctx: SyntaxContext,
+        include_stack: "List[Tuple[int, str]]",
+        resolve_external: bool,
+    ) -> "Optional[List[MatchPattern]]":
+        """ Get flatten `MatchPattern` list of `ctx` (memoized by name) """
+        # nested contexts can not be included, no need to memoize them
+        name = ctx.name
+        if name in self._flattened:
+            return self._flattened[name]
+
+        key = (id(self), name or "(anonymous)")
+        if include_stack and include_stack[0][0] != id(self):
+            key = (id(self), "scope:%s#%s" % (self.scope, key[1]))
+        if name is not None and key in include_stack:
+            chain = " -> ".join(label for _, label in include_stack + [key])
+            raise LinkError("recursive include: %s" % chain)
+
+        include_stack.append(key)
+        result: "Optional[List[MatchPattern]]" = []
+        for pattern in ctx.patterns:
+            if isinstance(pattern, MatchPattern):
+                result.append(obj_proxy(pattern))
+            elif isinstance(pattern, IncludePattern):
+                if pattern.is_external and not resolve_external:
+                    result = None  # flattened on first use
+                    break
+                included = pattern.context
+                pats = included.syndef._flatten(
+                    included, include_stack, resolve_external
+                )
+                if pats is None:
+                    result = None
+                    break
+                result.extend(pats)
+            else:
+                raise ValueError
+        include_stack.pop()
+
+        if name is not None and result is not None:
+            self._flattened[name] = result
+        return result
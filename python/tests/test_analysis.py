@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from hlkit.analysis import (
+    FLAG_AMBIGUOUS_ALTERNATION,
+    FLAG_INVALID,
+    FLAG_NESTED_QUANTIFIER,
+    FLAG_NO_LITERAL_PREFIX,
+    FLAG_UNANCHORED,
+    analyze_syntax,
+    main,
+    regex_flags,
+)
+from hlkit.syntax import SyntaxDefinition
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+ASSETS_DIR = os.path.abspath(ASSETS_DIR)
+
+JSON_SYNTAX = os.path.join(ASSETS_DIR, "Packages/JSON/JSON.sublime-syntax")
+
+
+@pytest.mark.parametrize(
+    "regex, flags",
+    [
+        (r"^---", []),
+        (r"\[", [FLAG_UNANCHORED]),
+        (r"\S+", [FLAG_NO_LITERAL_PREFIX, FLAG_UNANCHORED]),
+        (r"^(a+)+$", [FLAG_NESTED_QUANTIFIER]),
+        (r"^(?:\w*\s)*x", [FLAG_NESTED_QUANTIFIER, FLAG_NO_LITERAL_PREFIX]),
+        (r"^(a|ab)*c", [FLAG_AMBIGUOUS_ALTERNATION, FLAG_NO_LITERAL_PREFIX]),
+        (r"^(a|b)*c", [FLAG_NO_LITERAL_PREFIX]),
+        (r"^(?:a|b)?c", [FLAG_NO_LITERAL_PREFIX]),
+        (r"^a\z", [FLAG_INVALID]),
+        # a leading `]` does not close the class
+        (r"^[]](a+)+", [FLAG_NESTED_QUANTIFIER]),
+        (r"^[^]](a+)+", [FLAG_NESTED_QUANTIFIER, FLAG_NO_LITERAL_PREFIX]),
+        # `*` after an escaped `*` is not possessive
+        (r"^(a\**)+", [FLAG_NESTED_QUANTIFIER]),
+        (r"^(a{2})*", [FLAG_NO_LITERAL_PREFIX]),
+    ],
+)
+def test_regex_flags(regex, flags):
+    assert regex_flags(regex) == flags
+
+
+def test_analyze_syntax():
+    syndef = SyntaxDefinition.load_file(JSON_SYNTAX)
+    report = analyze_syntax(syndef)
+
+    contexts = {c.label: c for c in report.contexts}
+    assert contexts["main"].flattened_count == 9
+    assert contexts["array[0]"].context.meta_scope == "meta.sequence.json"
+    assert report.ranked_contexts()[0].label == "array[0]"
+
+    # comments are included by the prototype of most contexts
+    comments = [p for p in report.patterns if p.context == "comments"]
+    assert all(p.used_by > 1 for p in comments)
+
+    worst = report.ranked_patterns()[0]
+    assert worst.context == "number"
+    assert FLAG_NO_LITERAL_PREFIX in worst.flags
+    assert all(p.seconds is None for p in report.patterns)
+
+
+def test_benchmark():
+    syndef = SyntaxDefinition.load_file(JSON_SYNTAX)
+    report = analyze_syntax(syndef, ['{"a": [1, 2]}\n'] * 10, repeat=1)
+    assert all(p.seconds is not None for p in report.patterns)
+    assert "patterns by cost:" in report.format(top=3)
+
+
+def test_main(capsys):
+    assert main([JSON_SYNTAX, "--top", "2"]) == 0
+    assert "JSON (source.json)" in capsys.readouterr().out
+    assert main([JSON_SYNTAX, "--fail-score", "10"]) == 1
@@ -0,0 +1,143 @@
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+from hlkit.diskcache import FORMAT_EVENTS, FORMAT_TOKENS, DiskCache
+from hlkit.parse import ParseState
+from hlkit.syntax import SyntaxDefinition
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+ASSETS_DIR = os.path.abspath(ASSETS_DIR)
+
+DOCUMENT = '{\n  "a": [1, 2.5, true],\n  "b": "x\\ty" // end\n}\n'
+
+
+def load_syntax(path):
+    fullpath = Path(os.path.join(ASSETS_DIR, path))
+    data = yaml.load(fullpath.read_text(), yaml.FullLoader)
+    return SyntaxDefinition.load(data)
+
+
+def dump(results):
+    return [[(t.text, t.scopes) for t in r.tokens] for r in results]
+
+
+class TestDiskCache(object):
+    syndef: SyntaxDefinition
+
+    def setup_method(self, method):
+        self.syndef = load_syntax("Packages/JSON/JSON.sublime-syntax")
+
+    def test_tokens(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        state = ParseState(self.syndef)
+        expected = dump(map(state.parse_line, DOCUMENT.splitlines(True)))
+
+        with DiskCache(path) as cache:
+            for _ in range(2):
+                result = cache.highlight(self.syndef, DOCUMENT)
+                assert dump(result) == expected
+            assert cache.hits == 1
+            assert cache.misses == 1
+            assert len(cache) == 1
+
+        # persistent across instances (and processes)
+        with DiskCache(path) as cache:
+            result = cache.highlight(self.syndef, DOCUMENT)
+            assert dump(result) == expected
+            assert cache.hits == 1
+
+    def test_events(self, tmp_path):
+        state = ParseState(self.syndef)
+        lines = DOCUMENT.splitlines(True)
+        expected = [state.parse_line_events(line).events for line in lines]
+
+        with DiskCache(str(tmp_path / "cache.sqlite")) as cache:
+            cache.highlight(self.syndef, DOCUMENT, fmt=FORMAT_TOKENS)
+            for _ in range(2):
+                result = cache.highlight(
+                    self.syndef, DOCUMENT, fmt=FORMAT_EVENTS
+                )
+                assert [r.events for r in result] == expected
+            assert cache.stats["hits"] == 1
+            assert cache.stats["misses"] == 2
+            assert cache.stats["entries"] == 2
+
+            with pytest.raises(ValueError):
+                cache.highlight(self.syndef, DOCUMENT, fmt="html")
+
+    def test_grammar_identity(self):
+        other = load_syntax("Packages/YAML/YAML.sublime-syntax")
+        key = DiskCache.make_key(self.syndef, DOCUMENT, FORMAT_TOKENS)
+        assert key == DiskCache.make_key(self.syndef, DOCUMENT, FORMAT_TOKENS)
+        assert key != DiskCache.make_key(other, DOCUMENT, FORMAT_TOKENS)
+        assert key != DiskCache.make_key(self.syndef, DOCUMENT, FORMAT_EVENTS)
+        longer = DOCUMENT + "\n"
+        assert key != DiskCache.make_key(self.syndef, longer, FORMAT_TOKENS)
+
+    def test_parser_revision(self, monkeypatch):
+        key = DiskCache.make_key(self.syndef, DOCUMENT, FORMAT_TOKENS)
+        monkeypatch.setattr("hlkit.diskcache.PARSER_REVISION", -1)
+        assert key != DiskCache.make_key(self.syndef, DOCUMENT, FORMAT_TOKENS)
+
+    def test_eviction(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        with DiskCache(path, max_bytes=400) as cache:
+            line = "[%d, %d, %d]\n"
+            documents = [line % (i, i * 7, i * 13) * 5 for i in range(10)]
+            for document in documents:
+                cache.highlight(self.syndef, document)
+
+            assert cache.evictions > 0
+            assert cache.total_bytes <= 400
+
+            # most recent document is kept
+            cache.highlight(self.syndef, documents[-1])
+            assert cache.hits == 1
+
+    def test_too_large(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        with DiskCache(path, max_bytes=400) as cache:
+            cache.highlight(self.syndef, "1\n")
+            document = "".join("[%d, %d]\n" % (i, i * 7) for i in range(100))
+            assert dump(cache.highlight(self.syndef, document)) == dump(
+                cache.highlight(self.syndef, document)
+            )
+
+            # not stored, nothing evicted for it
+            assert cache.misses == 3
+            assert cache.evictions == 0
+            assert len(cache) == 1
+
+    def test_atime(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+
+        def atimes():
+            with DiskCache(path) as reader:
+                rows = reader._conn.execute("SELECT key, atime FROM entries")
+                return dict(rows.fetchall())
+
+        with DiskCache(path) as cache:
+            cache.highlight(self.syndef, "1\n")
+            cache.highlight(self.syndef, "2\n")
+            stored = atimes()
+
+            # recent entries are not refreshed at all
+            cache.highlight(self.syndef, "1\n")
+            assert cache._pending_atimes == {}
+
+            # older ones are refreshed with the next write
+            cache.atime_resolution = 0
+            cache.highlight(self.syndef, "1\n")
+            assert atimes() == stored
+            cache.highlight(self.syndef, "3\n")
+            refreshed = atimes()
+            key = DiskCache.make_key(self.syndef, "1\n", FORMAT_TOKENS)
+            assert refreshed[key] > stored[key]
+
+            # or on close
+            cache.highlight(self.syndef, "2\n")
+        key = DiskCache.make_key(self.syndef, "2\n", FORMAT_TOKENS)
+        assert atimes()[key] > refreshed[key]
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+from hlkit.lsp import (
+    SemanticTokensBuilder,
+    SemanticTokensLegend,
+    semantic_tokens,
+)
+from hlkit.offsets import UTF8
+from hlkit.parse import ParseState
+from hlkit.syntax import SyntaxDefinition
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+ASSETS_DIR = os.path.abspath(ASSETS_DIR)
+
+
+@pytest.fixture(scope="module")
+def syndef():
+    path = os.path.join(ASSETS_DIR, "Packages/JSON/JSON.sublime-syntax")
+    return SyntaxDefinition.load_file(path)
+
+
+class TestSemanticTokensLegend(object):
+    def test_classify(self):
+        legend = SemanticTokensLegend()
+        string = legend.token_types.index("string")
+        keyword = legend.token_types.index("keyword")
+        readonly = 1 << legend.token_modifiers.index("readonly")
+
+        assert legend.classify(["source.json"]) is None
+        assert legend.classify(["source.x", "string.quoted.x"]) == (string, 0)
+        # innermost scope wins, within a scope field too
+        scopes = ["string.x", "meta.key.x constant.language.x"]
+        assert legend.classify(scopes) == (keyword, readonly)
+
+    def test_unknown_types_dropped(self):
+        legend = SemanticTokensLegend(["number"], [])
+        assert legend.classify(["string.x"]) is None
+        assert legend.classify(["constant.numeric.x"]) == (0, 0)
+        assert legend.to_dict() == {
+            "tokenTypes": ["number"],
+            "tokenModifiers": [],
+        }
+
+
+class TestSemanticTokens(object):
+    def test_encode(self, syndef):
+        legend = SemanticTokensLegend(["string", "number", "keyword"], [])
+        lines = ['{"é\U0001f600": 1,\n', '  "b": [true]}\n']
+        data = semantic_tokens(ParseState(syndef), lines, legend)
+
+        assert data == [
+            # `"é😀` (closing quote has no string scope), UTF-16 units
+            0, 1, 4, 0, 0,
+            # `1`
+            0, 7, 1, 1, 0,
+            # `"b"` on the next line
+            1, 2, 2, 0, 0,
+            # `true`
+            0, 6, 4, 2, 0,
+        ]  # fmt: skip
+
+    def test_utf8(self, syndef):
+        legend = SemanticTokensLegend(["string"], [])
+        data = semantic_tokens(ParseState(syndef), ['"\U0001f600"\n'], legend)
+        assert data[:3] == [0, 0, 3]
+
+        state = ParseState(syndef)
+        lines = ['"\U0001f600"\n']
+        data = semantic_tokens(state, lines, legend, encoding=UTF8)
+        assert data[:3] == [0, 0, 5]
+
+    def test_needs_offsets(self, syndef):
+        state = ParseState(syndef)
+        builder = SemanticTokensBuilder(state, SemanticTokensLegend())
+        with pytest.raises(ValueError, match="no offsets"):
+            builder.add_line(state.parse_line("1\n"))
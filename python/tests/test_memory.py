@@ -0,0 +1,62 @@
+import os
+
+import pytest
+from hlkit.cache import LineCache
+from hlkit.memory import pool_memory, state_memory, syntax_memory
+from hlkit.parse import ParseState
+from hlkit.pool import GrammarPool
+from hlkit.syntax import SyntaxDefinition
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+ASSETS_DIR = os.path.abspath(ASSETS_DIR)
+
+
+@pytest.fixture
+def syndef():
+    path = os.path.join(ASSETS_DIR, "Packages/JSON/JSON.sublime-syntax")
+    return SyntaxDefinition.load_file(path)
+
+
+def test_syntax_memory(syndef):
+    usage = syntax_memory(syndef)
+    assert usage.total == sum(usage.parts.values())
+    assert usage["contexts"] > 0
+    assert usage["regexes"] > 0
+    assert usage["flattened"] > 0
+    # regexes are compiled on first use
+    assert usage["compiled"] == 0
+
+    ParseState(syndef).parse_line('{"a": [1, true]}\n')
+    parsed = syntax_memory(syndef)
+    assert parsed["compiled"] > 0
+    assert parsed["contexts"] == usage["contexts"]
+    assert parsed.total > usage.total
+
+
+def test_state_memory(syndef):
+    state = ParseState(syndef)
+    usage = state_memory(state)
+    assert usage["levels"] > 0
+    # the grammar is not part of the state
+    assert usage.total < syntax_memory(syndef)["contexts"]
+
+    state.parse_line("[" * 100)
+    deep = state_memory(state)
+    assert deep["levels"] > usage["levels"] * 50
+
+    state = ParseState(syndef, line_cache=LineCache())
+    assert state_memory(state)["line_cache"] > 0
+    before = state_memory(state)["line_cache"]
+    state.parse_line("[1, 2]\n")
+    assert state_memory(state)["line_cache"] > before
+
+
+def test_pool_memory():
+    pool = GrammarPool([ASSETS_DIR])
+    assert pool_memory(pool) == {}
+
+    pool.get_by_scope("source.json")
+    usage = pool_memory(pool)
+    assert list(usage) == ["source.json"]
+    assert usage["source.json"].total > 0
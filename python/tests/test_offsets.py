@@ -0,0 +1,37 @@
+import pytest
+from hlkit.offsets import CODEPOINT, UTF8, UTF16, OffsetIndex
+
+LINE = "aé中\U0001f600b\n"
+
+
+class TestOffsetIndex(object):
+    def test_ascii(self):
+        for encoding in (CODEPOINT, UTF16, UTF8):
+            index = OffsetIndex("abc\n", encoding)
+            assert index.is_identity
+            assert index[3] == 3
+
+    def test_codepoint(self):
+        index = OffsetIndex(LINE, CODEPOINT)
+        assert index.is_identity
+        assert index[len(LINE)] == len(LINE)
+
+    def test_utf16(self):
+        index = OffsetIndex(LINE, UTF16)
+        offsets = [index[i] for i in range(len(LINE) + 1)]
+        assert offsets == [0, 1, 2, 3, 5, 6, 7]
+        assert index[len(LINE)] == len(LINE.encode("utf-16-le")) // 2
+
+    def test_utf16_bmp(self):
+        # no surrogate pairs, offsets are unchanged
+        assert OffsetIndex("é中", UTF16).is_identity
+
+    def test_utf8(self):
+        index = OffsetIndex(LINE, UTF8)
+        offsets = [index[i] for i in range(len(LINE) + 1)]
+        assert offsets == [0, 1, 3, 6, 10, 11, 12]
+        assert index[len(LINE)] == len(LINE.encode("utf-8"))
+
+    def test_unknown(self):
+        with pytest.raises(ValueError, match="unknown offset encoding"):
+            OffsetIndex("a", "utf-32")
@@ -1,9 +1,17 @@
 import os
 from pathlib import Path
 
+import pytest
 import yaml
+from hlkit.cache import LineCache
 from hlkit.syntax import MatchPattern, SyntaxDefinition
-from hlkit.parse import ParseResult, ParseState
+from hlkit.parse import (
+    OVERFLOW_DEGRADE,
+    ParseResult,
+    ParseState,
+    ScopeEvents,
+    StackDepthError,
+)
 
 BASE_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
 ASSETS_DIR = os.path.join(BASE_DIR, "assets")
@@ -189,3 +197,269 @@ class TestParseState(object):
         result = state.parse_next_token(line)
         assert result.tokens[0].text == "["
         assert state.level_stack[-1].current_ctx.meta_scope == "meta.sequence.json"
+
+    def test_line_events(self):
+        state = ParseState(self.syndef)
+        E = ScopeEvents
+
+        result = state.parse_line_events('[1, "a"]\n')
+        assert isinstance(result, ScopeEvents)
+        tokens = ParseState(self.syndef).parse_line('[1, "a"]\n').tokens
+        assert result.tokens_count == len(tokens)
+        assert result.events[:4] == [
+            (0, E.PUSH, "source.json"),
+            (0, E.PUSH, "meta.sequence.json"),
+            (0, E.PUSH, "punctuation.section.sequence.begin.json"),
+            (0, E.TEXT, "["),
+        ]
+        assert result.events[-5:] == [
+            (7, E.POP, "meta.sequence.json"),
+            (7, E.PUSH, "punctuation.section.sequence.end.json"),
+            (7, E.TEXT, "]"),
+            (8, E.POP, "punctuation.section.sequence.end.json"),
+            (8, E.TEXT, "\n"),
+        ]
+        assert state.event_scopes == ["source.json"]
+
+        # scopes opened on previous line are not pushed again
+        result = state.parse_line_events("null\n")
+        assert result.events[0] == (0, E.PUSH, "constant.language.json")
+
+    def test_line_events_replay(self):
+        """ replaying events gives the same tokens as `parse_line` """
+        lines = ['{"a": [1, 2.5, true],\n', '  "b\\n": null} // end\n']
+        token_state = ParseState(self.syndef)
+        event_state = ParseState(self.syndef)
+
+        opened = []
+        for line in lines:
+            tokens = token_state.parse_line(line).tokens
+            replayed = []
+            for _, op, value in event_state.parse_line_events(line).events:
+                if op == ScopeEvents.PUSH:
+                    opened.append(value)
+                elif op == ScopeEvents.POP:
+                    assert opened.pop() == value
+                else:
+                    replayed.append((value, list(opened)))
+            assert replayed == [(t.text, t.scopes) for t in tokens]
+
+    def test_line_events_deep(self):
+        """ events of deep stacks, beyond `max_depth` included """
+        state = ParseState(self.syndef)
+        state.parse_line_events("[" * 300 + "\n")
+        assert len(state.event_scopes) == 301
+
+        E = ScopeEvents
+        assert state.parse_line_events("1]\n").events == [
+            (0, E.PUSH, "meta.number.integer.decimal.json"),
+            (0, E.PUSH, "constant.numeric.value.json"),
+            (0, E.TEXT, "1"),
+            (1, E.POP, "constant.numeric.value.json"),
+            (1, E.POP, "meta.number.integer.decimal.json"),
+            (1, E.POP, "meta.sequence.json"),
+            (1, E.PUSH, "punctuation.section.sequence.end.json"),
+            (1, E.TEXT, "]"),
+            (2, E.POP, "punctuation.section.sequence.end.json"),
+            (2, E.TEXT, "\n"),
+        ]
+        assert len(state.event_scopes) == 300
+
+        # levels beyond `max_depth` open no scopes
+        state = ParseState(
+            self.syndef, max_depth=4, on_overflow=OVERFLOW_DEGRADE
+        )
+        result = state.parse_line_events("[" * 300 + '"a"\n')
+        assert len(state.event_scopes) == 4
+        assert result.events[-4:] == [
+            (302, E.PUSH, "punctuation.definition.string.end.json"),
+            (302, E.TEXT, '"'),
+            (303, E.POP, "punctuation.definition.string.end.json"),
+            (303, E.TEXT, "\n"),
+        ]
+
+        result = state.parse_line_events("]" * 300 + "\n")
+        assert result.events[-5:] == [
+            (299, E.POP, "meta.sequence.json"),
+            (299, E.PUSH, "punctuation.section.sequence.end.json"),
+            (299, E.TEXT, "]"),
+            (300, E.POP, "punctuation.section.sequence.end.json"),
+            (300, E.TEXT, "\n"),
+        ]
+        assert state.event_scopes == ["source.json"]
+
+    def test_parse_line_coalesce(self):
+        line = '[ab, "x\\ty"]\n'
+        result = ParseState(self.syndef).parse_line(line)
+        coalesced = ParseState(self.syndef).parse_line(line, coalesce=True)
+
+        assert "".join(t.text for t in coalesced.tokens) == line
+        assert len(coalesced) < len(result)
+        # `a` and `b` are matched one by one with the same scopes
+        assert [t.text for t in result.tokens[1:3]] == ["a", "b"]
+        assert coalesced.tokens[1].text == "ab"
+        assert coalesced.tokens[1].scopes == [
+            "source.json",
+            "meta.sequence.json",
+            "invalid.illegal.expected-sequence-separator.json",
+        ]
+        for prev, token in zip(coalesced.tokens, coalesced.tokens[1:]):
+            assert prev.scopes != token.scopes
+
+    def test_line_cache(self):
+        lines = ["[\n", "  1,\n", "  1,\n", "  {},\n", "  1,\n", "]\n", "[\n"]
+        cache = LineCache(maxsize=16)
+        state = ParseState(self.syndef, line_cache=cache)
+        plain_state = ParseState(self.syndef)
+
+        for line in lines:
+            result = state.parse_line(line)
+            expected = plain_state.parse_line(line)
+            assert [(t.text, t.scopes) for t in result.tokens] == [
+                (t.text, t.scopes) for t in expected.tokens
+            ]
+            assert state.fingerprint == plain_state.fingerprint
+
+        # "  1," x2 and "[" in the same state
+        assert cache.hits == 3
+        assert cache.misses == 4
+        assert cache.hit_rate == 3 / 7
+        assert len(cache) == 4
+
+    def test_line_cache_copies(self):
+        cache = LineCache()
+        ParseState(self.syndef, line_cache=cache).parse_line("1\n")
+
+        result = ParseState(self.syndef, line_cache=cache).parse_line("1\n")
+        assert cache.hits == 1
+        result.tokens[0].scopes.append("changed")
+        result.tokens[0].text = "changed"
+
+        result = ParseState(self.syndef, line_cache=cache).parse_line("1\n")
+        assert cache.hits == 2
+        assert result.tokens[0].text == "1"
+        assert "changed" not in result.tokens[0].scopes
+
+    def test_line_cache_eviction(self):
+        cache = LineCache(maxsize=2)
+        state = ParseState(self.syndef, line_cache=cache)
+        for line in ["1\n", "2\n", "3\n", "1\n"]:
+            state.parse_line(line)
+        assert len(cache) == 2
+        assert cache.hits == 0
+
+    def test_parse_line_offsets(self):
+        line = '["\U0001f600", 1]\n'
+        cache = LineCache()
+        state = ParseState(self.syndef, line_cache=cache)
+        tokens = state.parse_line(line).tokens
+        assert all(t.start is None and t.end is None for t in tokens)
+
+        for offsets, one in [("codepoint", 6), ("utf-16", 7), ("utf-8", 9)]:
+            state = ParseState(self.syndef, line_cache=cache)
+            tokens = state.parse_line(line, offsets=offsets).tokens
+            assert [t.start for t in tokens if t.text == "1"] == [one]
+            assert tokens[-1].end == one + 3
+            assert all(a.end == b.start for a, b in zip(tokens, tokens[1:]))
+
+    def test_line_events_offsets(self):
+        state = ParseState(self.syndef)
+        result = state.parse_line_events('"é\U0001f600"\n', offsets="utf-16")
+        events = result.events
+        texts = [(e[0], e[2]) for e in events if e[1] == ScopeEvents.TEXT]
+        assert texts == [(0, '"'), (1, "é\U0001f600"), (4, '"'), (5, "\n")]
+
+    def test_max_depth(self):
+        state = ParseState(self.syndef, max_depth=4)
+        state.parse_line("[[[\n")
+        assert len(state.level_stack) == 4
+        message = "more than 4 nested contexts"
+        with pytest.raises(StackDepthError, match=message):
+            state.parse_line("[\n")
+
+        with pytest.raises(ValueError, match="max_depth must be positive"):
+            ParseState(self.syndef, max_depth=0)
+        with pytest.raises(ValueError, match="unknown on_overflow"):
+            ParseState(self.syndef, on_overflow="ignore")
+
+    def test_max_depth_degrade(self):
+        line = "[" * 100 + "1" + "]" * 100 + "\n"
+        state = ParseState(
+            self.syndef, max_depth=4, on_overflow=OVERFLOW_DEGRADE
+        )
+        tokens = state.parse_line(line[:102]).tokens
+        assert state.depth == 100
+        # 97 flat levels, one of them popped by the first `]`
+        assert state.overflow == 96
+        assert len(state.level_stack) == 5
+        assert tokens[-2].scopes == [
+            "source.json",
+            "meta.sequence.json",
+            "meta.sequence.json",
+            "meta.sequence.json",
+            "meta.number.integer.decimal.json",
+            "constant.numeric.value.json",
+        ]
+
+        state.parse_line(line[102:])
+        assert len(state.level_stack) == 1
+        assert state.overflow == 0
+
+    def test_max_depth_degrade_deep(self):
+        state = ParseState(
+            self.syndef, max_depth=4, on_overflow=OVERFLOW_DEGRADE
+        )
+        for _ in range(10):
+            state.parse_line("[" * 1000 + "\n")
+        assert len(state.level_stack) <= state.max_depth + 1
+        assert state.depth == 10001
+
+        # strings nested in the flat levels keep them in sync
+        state.parse_line('"a"' + "]" * 9999 + "\n")
+        assert len(state.level_stack) <= state.max_depth + 1
+        assert state.depth == 2
+        state.parse_line(']"b"\n')
+        assert len(state.level_stack) == 1
+
+    def test_max_depth_degrade_balanced(self):
+        line = '[[[["a"]]]]\n'
+        state = ParseState(
+            self.syndef, max_depth=3, on_overflow=OVERFLOW_DEGRADE
+        )
+        tokens = state.parse_line(line).tokens
+        assert len(state.level_stack) == 1
+        assert state.overflow == 0
+
+        # deeper contexts are still parsed, without their scopes
+        outer = ["source.json", "meta.sequence.json", "meta.sequence.json"]
+        assert [(t.text, t.scopes) for t in tokens[4:8]] == [
+            ('"', outer + ["punctuation.definition.string.begin.json"]),
+            ("a", outer),
+            ('"', outer + ["punctuation.definition.string.end.json"]),
+            ("]", outer + ["punctuation.section.sequence.end.json"]),
+        ]
+
+    def test_max_depth_line_cache(self):
+        cache = LineCache()
+
+        def limited():
+            return ParseState(
+                self.syndef,
+                line_cache=cache,
+                max_depth=2,
+                on_overflow=OVERFLOW_DEGRADE,
+            )
+
+        unlimited = ParseState(self.syndef, line_cache=cache)
+        states = [limited(), unlimited, limited()]
+        for state in states:
+            state.parse_line("[[[\n")
+
+        # states with other limits do not share entries
+        assert cache.hits == 1
+        assert len(states[1].level_stack) == 4
+        for state in [states[0], states[2]]:
+            assert len(state.level_stack) == 3
+            assert state.depth == 4
+            assert state.overflow == 2
+        assert states[0].fingerprint != states[1].fingerprint
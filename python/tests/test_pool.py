@@ -0,0 +1,364 @@
+import os
+
+import pytest
+from hlkit.cache import LineCache
+from hlkit.diskcache import DiskCache
+from hlkit.parse import ParseState
+from hlkit.pool import GrammarPool, default_pool
+from hlkit.syntax import LinkError, SyntaxDefinition
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+ASSETS_DIR = os.path.abspath(ASSETS_DIR)
+
+HOST_SYNTAX = r"""%YAML 1.2
+---
+name: Host
+scope: text.host
+contexts:
+  main:
+    - match: '<<'
+      scope: punctuation.begin.host
+      embed: scope:source.inner
+      embed_scope: source.inner.embedded.host
+      escape: '>>'
+      escape_captures:
+        0: punctuation.end.host
+    - match: '\['
+      push: Packages/Inner/Inner.sublime-syntax#bracket
+    - include: scope:source.inner#words
+"""
+
+INNER_SYNTAX = r"""%YAML 1.2
+---
+name: Inner
+scope: source.inner
+contexts:
+  main:
+    - match: '\d+'
+      scope: constant.numeric.inner
+    - match: '\('
+      push:
+        - meta_scope: meta.group.inner
+        - match: '\)'
+          pop: true
+  bracket:
+    - match: '\]'
+      pop: true
+  words:
+    - match: '\bword\b'
+      scope: keyword.inner
+"""
+
+
+def write_syntaxes(root):
+    for name, text in [("Host", HOST_SYNTAX), ("Inner", INNER_SYNTAX)]:
+        package_dir = root / "Packages" / name
+        package_dir.mkdir(parents=True)
+        (package_dir / ("%s.sublime-syntax" % name)).write_text(text)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    write_syntaxes(tmp_path)
+    return GrammarPool([str(tmp_path)])
+
+
+def tokens(state, line):
+    return [(t.text, t.scopes) for t in state.parse_line(line).tokens]
+
+
+class TestGrammarPool(object):
+    def test_index(self, pool):
+        assert pool.scopes == ["source.inner", "text.host"]
+        assert pool.loaded == []
+
+    def test_lazy_loading(self, pool):
+        host = pool.get_by_scope("text.host")
+        assert pool.loaded == [host]
+
+        # `main` includes another syntax, flattened on first use
+        assert host["main"]._matches is None
+        state = ParseState(host)
+        assert len(state.current_level.matches) == 3
+
+        inner = pool.get_by_scope("source.inner")
+        assert len(pool.loaded) == 2
+        assert pool.get_by_path("Packages/Inner/Inner.sublime-syntax") is inner
+
+    def test_embed(self, pool):
+        host = pool.get_by_scope("text.host")
+        state = ParseState(host)
+        embedded = "source.inner.embedded.host"
+
+        assert tokens(state, "a<<1 (2>> word\n") == [
+            ("a", ["text.host"]),
+            ("<<", ["text.host", "punctuation.begin.host"]),
+            ("1", ["text.host", embedded, "constant.numeric.inner"]),
+            (" ", ["text.host", embedded]),
+            ("(", ["text.host", embedded, "meta.group.inner"]),
+            ("2", ["text.host", embedded, "meta.group.inner"]),
+            # escape pops the nested context of the embedded syntax too
+            (">>", ["text.host", "punctuation.end.host"]),
+            (" ", ["text.host"]),
+            ("word", ["text.host", "keyword.inner"]),
+            ("\n", ["text.host"]),
+        ]
+        assert len(state.level_stack) == 1
+
+    def test_embed_across_lines(self, pool):
+        host = pool.get_by_scope("text.host")
+        state = ParseState(host)
+        state.parse_line("<<1\n")
+        assert state.current_level.escape_level == 1
+        escape = (">>", ["text.host", "punctuation.end.host"])
+        assert tokens(state, "2>>\n")[1] == escape
+
+    def test_escape_backrefs(self, pool):
+        data = {
+            "scope": "text.fence",
+            "contexts": {
+                "main": [
+                    {
+                        "match": "(`+)",
+                        "embed": "scope:source.inner",
+                        "escape": "\\1",
+                        "escape_captures": {0: "punctuation.end.fence"},
+                    }
+                ]
+            },
+        }
+        fence = SyntaxDefinition.load(data, pool=pool)
+        line_cache = LineCache()
+
+        short = ParseState(fence, line_cache=line_cache)
+        short.parse_line("``\n")
+        short_fingerprint = short.fingerprint
+        assert tokens(short, "1```\n")[1] == (
+            "``",
+            ["text.fence", "punctuation.end.fence"],
+        )
+
+        # same contexts, the escape told apart by the fingerprint
+        long = ParseState(fence, line_cache=line_cache)
+        long.parse_line("```\n")
+        assert long.fingerprint != short_fingerprint
+        assert tokens(long, "1``\n")[1] == ("``\n", ["text.fence"])
+        assert tokens(long, "```\n")[0] == (
+            "```",
+            ["text.fence", "punctuation.end.fence"],
+        )
+
+    def test_escape_lookahead(self):
+        pool = GrammarPool()
+        peek = {
+            "scope": "source.peek",
+            "contexts": {
+                "main": [
+                    {"match": "\\w+(?=>>)", "scope": "entity.name.peek"},
+                    {"match": "-+>*", "scope": "keyword.operator.peek"},
+                ]
+            },
+        }
+        pool.add(SyntaxDefinition.load(peek, pool=pool))
+        data = {
+            "scope": "text.host",
+            "contexts": {
+                "main": [
+                    {
+                        "match": "<<",
+                        "embed": "scope:source.peek",
+                        "escape": ">>",
+                    }
+                ]
+            },
+        }
+        host = SyntaxDefinition.load(data, pool=pool)
+        state = ParseState(host)
+
+        # the embedded syntax sees the rest of the line, up to the escape
+        result = tokens(state, "<<a>>\n")
+        assert result[1] == ("a", ["text.host", "entity.name.peek"])
+        assert result[2] == (">>", ["text.host"])
+
+        result = tokens(state, "<<-->>\n")
+        assert result[1] == ("--", ["text.host", "keyword.operator.peek"])
+        assert result[2] == (">>", ["text.host"])
+
+    def test_nested_escapes(self, pool):
+        middle = {
+            "scope": "source.middle",
+            "contexts": {
+                "main": [
+                    {
+                        "match": "\\[\\[",
+                        "embed": "scope:source.inner",
+                        "escape": "\\]\\]",
+                    }
+                ]
+            },
+        }
+        pool.add(SyntaxDefinition.load(middle, pool=pool))
+        data = {
+            "scope": "text.outer",
+            "contexts": {
+                "main": [
+                    {
+                        "match": "<<",
+                        "embed": "scope:source.middle",
+                        "escape": ">>",
+                        "escape_captures": {0: "punctuation.end.outer"},
+                    }
+                ]
+            },
+        }
+        outer = SyntaxDefinition.load(data, pool=pool)
+        state = ParseState(outer)
+
+        # the outer escape comes first, it pops both embedded syntaxes
+        result = tokens(state, "<<[[1>>2]]\n")
+        assert result[3] == (">>", ["text.outer", "punctuation.end.outer"])
+        assert result[4] == ("2]]\n", ["text.outer"])
+        assert len(state.level_stack) == 1
+
+    def test_push_file(self, pool):
+        host = pool.get_by_scope("text.host")
+        state = ParseState(host)
+        state.parse_line("[\n")
+        inner = pool.get_by_scope("source.inner")
+        assert state.current_level.key == inner["bracket"].link_id
+
+    def test_shared(self, pool, tmp_path):
+        host = pool.get_by_scope("text.host")
+        other = SyntaxDefinition.load_file(
+            str(tmp_path / "Packages/Host/Host.sublime-syntax"), pool=pool
+        )
+        ParseState(host).parse_line("<<1>>\n")
+        ParseState(other).parse_line("<<1>>\n")
+        assert len(pool.loaded) == 2  # inner syntax is loaded only once
+
+    def test_unknown(self):
+        data = {
+            "scope": "text.x",
+            "contexts": {"main": [{"include": "scope:source.nowhere"}]},
+        }
+        syndef = SyntaxDefinition.load(data, pool=GrammarPool())
+
+        # parsed as an empty context, and recorded
+        assert tokens(ParseState(syndef), "a\n") == [("a\n", ["text.x"])]
+        assert syndef.missing_syntaxes == ["scope:source.nowhere"]
+
+    def test_cross_syntax_recursion(self):
+        pool = GrammarPool()
+        scopes = [("source.a", "source.b"), ("source.b", "source.a")]
+        for scope, other in scopes:
+            data = {
+                "scope": scope,
+                "contexts": {"main": [{"include": "scope:%s" % other}]},
+            }
+            pool.add(SyntaxDefinition.load(data, pool=pool))
+        with pytest.raises(LinkError, match="recursive include"):
+            ParseState(pool.get_by_scope("source.a"))
+
+        # references are followed once each for the digest
+        syndef_a = pool.get_by_scope("source.a")
+        syndef_b = pool.get_by_scope("source.b")
+        assert syndef_a.digest != syndef_b.digest
+
+    def test_digest(self, tmp_path):
+        write_syntaxes(tmp_path / "base")
+        pool = GrammarPool([str(tmp_path / "base")])
+        host = pool.get_by_scope("text.host")
+        assert host.external_references() == [
+            ("scope", "source.inner"),
+            ("file", "Packages/Inner/Inner.sublime-syntax"),
+        ]
+
+        # same host, another version of the embedded syntax
+        other_root = tmp_path / "other"
+        write_syntaxes(other_root)
+        inner_path = other_root / "Packages/Inner/Inner.sublime-syntax"
+        inner_text = inner_path.read_text().replace("numeric", "changed")
+        inner_path.write_text(inner_text)
+        other_pool = GrammarPool([str(other_root)])
+        other_host = other_pool.get_by_scope("text.host")
+
+        assert host._own_digest() == other_host._own_digest()
+        assert host.digest != other_host.digest
+        assert host.digest == pool.get_by_scope("text.host").digest
+
+        # referenced syntaxes are identified by the pool index, not loaded
+        assert pool.loaded == [host]
+        assert other_pool.loaded == [other_host]
+
+        with DiskCache(str(tmp_path / "cache.sqlite")) as cache:
+            cache.highlight(host, "<<1>>\n")
+            result = cache.highlight(other_host, "<<1>>\n")
+            changed = result[0].tokens[1].scopes[-1]
+            assert changed == "constant.changed.inner"
+
+    def test_digest_unknown(self):
+        data = {
+            "scope": "text.x",
+            "contexts": {"main": [{"include": "scope:source.y"}]},
+        }
+        pool = GrammarPool()
+        syndef = SyntaxDefinition.load(data, pool=pool)
+        digest = syndef.digest
+
+        inner = {"scope": "source.y", "contexts": {"main": []}}
+        pool.add(SyntaxDefinition.load(inner, pool=pool))
+        assert syndef.digest != digest
+
+        # memoized until the pool changes
+        assert syndef.digest is syndef.digest
+
+    def test_max_loaded(self, tmp_path):
+        write_syntaxes(tmp_path)
+        pool = GrammarPool([str(tmp_path)], max_loaded=1)
+
+        host = pool.get_by_scope("text.host")
+        state = ParseState(host)
+        state.parse_line("<<1\n")
+        assert pool.loaded != [host]
+        assert pool.evictions == 1
+
+        # the embedded syntax is kept alive by the host
+        assert tokens(state, "2>>\n")[0][1][-1] == "constant.numeric.inner"
+
+        # evicted definitions are loaded again
+        assert pool.get_by_scope("text.host") is not host
+        assert pool.evictions == 2
+
+        # the state keeps its definition, the caller does not
+        pool = GrammarPool([str(tmp_path)], max_loaded=1)
+        state = ParseState(pool.get_by_scope("text.host"))
+        state.parse_line("<<1\n")
+        assert pool.evictions == 1
+        assert tokens(state, "2>>\n")[1] == (
+            ">>",
+            ["text.host", "punctuation.end.host"],
+        )
+
+        with pytest.raises(ValueError, match="max_loaded must be positive"):
+            GrammarPool(max_loaded=0)
+
+
+def test_missing_embedded_syntax():
+    # the bundled DOT syntax embeds HTML, which is not bundled
+    state = ParseState(default_pool().get_by_scope("source.dot"))
+    result = tokens(state, "a [label=<<b>x</b>>];\n")
+    attributes = ["source.dot", "meta.attributes.dot"]
+    assert result[-2:] == [
+        (";", attributes + ["punctuation.separator.dot"]),
+        ("\n", attributes),
+    ]
+    assert ("<b>x</b", attributes + ["source.dot.embedded.html"]) in result
+    assert state.syndef.missing_syntaxes == ["scope:text.html.basic"]
+
+
+def test_default_pool():
+    pool = default_pool()
+    assert pool is default_pool()
+    assert "source.json" in pool.scopes
+    assert pool.get_by_scope("source.json").name == "JSON"
@@ -0,0 +1,57 @@
+import pytest
+from hlkit.prefilter import Prefilter, analyze
+
+
+@pytest.mark.parametrize(
+    "regex, literal, first_chars",
+    [
+        (r"\[", "[", "["),
+        (r'"', '"', '"'),
+        (r"/\*\*(?!/)", "/**", "/"),
+        (r"(//).*$\n?", "//", "/"),
+        (r"^---", "---", "-"),
+        (r"^\.{3}", ".", "."),
+        (r"a+b", "a", "a"),
+        (r"ab?", "a", "a"),
+        (r":(?=\s|$)", ":", ":"),
+        (r"\b(?:true|false|null)\b", "", "tfn"),
+        (r"(?=[},\]])", "", "},]"),
+        (r"[{}|]", "", "{}|"),
+        (r"(?=\?)", "?", "?"),
+    ],
+)
+def test_analyze(regex, literal, first_chars):
+    prefilter = analyze(regex)
+    assert isinstance(prefilter, Prefilter)
+    assert prefilter.literal == literal
+    assert prefilter.first_chars == frozenset(first_chars)
+
+
+@pytest.mark.parametrize(
+    "regex",
+    [
+        r"",
+        r"|-",
+        r"\S+",
+        r"a?b",
+        r"a{0,2}",
+        r"(-?)(0|[1-9]\d*)",
+        r"[^\s\]]",
+        r"[a-z]",
+        r"\n|\z",
+        r"(?x) (\w+)",
+        r"(?i)abc",
+        r"(?<=a)b",
+        r"\s*(?=\})",
+        r"\b(a|b|c|d|e|f|g|h|i)\b",  # too many first chars
+    ],
+)
+def test_analyze_unknown(regex):
+    assert analyze(regex) is None
+
+
+def test_find():
+    assert analyze(r"/\*").find("a = 1 /* b */") == 6
+    assert analyze(r"/\*").find("a = 1 // b") == -1
+    assert analyze(r"\b(?:true|false|null)\b").find("[1, null, true]") == 4
+    assert analyze(r"\b(?:true|false|null)\b").find("[1, null]", 5) == -1
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+PYTHON_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+LAZY_MODULES = [
+    "yaml",
+    "typing",
+    "hashlib",
+    "json",
+    "sqlite3",
+    "cffi",
+    "hlkit._onig",
+]
+
+
+def imported_modules(code):
+    script = code + "\nimport sys\nprint('\\n'.join(sys.modules))"
+    env = dict(os.environ, PYTHONPATH=PYTHON_DIR)
+    output = subprocess.check_output([sys.executable, "-c", script], env=env)
+    return set(output.decode().split())
+
+
+def test_lazy_imports():
+    modules = imported_modules("import hlkit.parse, hlkit.onig")
+    assert "hlkit.parse" in modules
+    assert [name for name in LAZY_MODULES if name in modules] == []
+
+
+def test_load_file_imports_yaml():
+    synfile = "assets/Packages/JSON/JSON.sublime-syntax"
+    path = os.path.join(PYTHON_DIR, "..", synfile)
+    modules = imported_modules(
+        "from hlkit.syntax import SyntaxDefinition\n"
+        "syndef = SyntaxDefinition.load_file(%r)\n"
+        "syndef.digest" % path
+    )
+    assert "yaml" in modules
+    assert "hashlib" in modules
@@ -5,6 +5,7 @@ import pytest
 import yaml
 from hlkit.syntax import (
     IncludePattern,
+    LinkError,
     MatchPattern,
     MatchRegex,
     PopAction,
@@ -108,3 +109,99 @@ class TestStructure(object):
             expand_re("{{_type_int_binary}}{{_type_int_binary}}")
             == r"([-+]?)(0b)([0-1_]+)([-+]?)(0b)([0-1_]+)"
         )
+
+
+class TestLink(object):
+    def test_linked(self):
+        synfile = "Packages/JSON/JSON.sublime-syntax"
+        fullpath = Path(os.path.join(ASSETS_DIR, synfile))
+        data = yaml.load(fullpath.read_text(), yaml.FullLoader)
+        syndef = SyntaxDefinition.load(data)
+
+        pat_0 = syndef["value"].patterns[0]
+        assert isinstance(pat_0, IncludePattern)
+        assert pat_0.context.name == "constant"
+
+        # prototype + constant + number + string + array + object
+        assert len(syndef["main"].matches) == 9
+        assert len(syndef["prototype"].matches) == 3
+        assert syndef["main"].matches[3].scope == "constant.language.json"
+
+        # prefilters are computed by `link`
+        assert syndef["array"].patterns[0].match.prefilter.literal == "["
+        assert syndef["number"].patterns[0].match.prefilter is None
+
+    def test_recursive_include(self):
+        data = {
+            "contexts": {
+                "main": [{"include": "a"}],
+                "a": [{"match": "a"}, {"include": "b"}],
+                "b": [{"match": "b"}, {"include": "a"}],
+            }
+        }
+        message = "recursive include: main -> a -> b -> a"
+        with pytest.raises(LinkError, match=message):
+            SyntaxDefinition.load(data)
+
+    def test_undefined_context(self):
+        data = {"contexts": {"main": [{"match": "a", "push": "nowhere"}]}}
+        with pytest.raises(LinkError, match="undefined context: nowhere"):
+            SyntaxDefinition.load(data)
+
+        data = {"contexts": {"main": [{"include": "nowhere"}]}}
+        with pytest.raises(LinkError, match="undefined context: nowhere"):
+            SyntaxDefinition.load(data)
+
+    def test_embed_without_escape(self):
+        embed = {"match": "<", "embed": "scope:source.x"}
+        data = {"contexts": {"main": [{"match": "a", "push": [embed]}]}}
+        message = r"embed without escape: scope:source.x \(in main\)"
+        with pytest.raises(LinkError, match=message):
+            SyntaxDefinition.load(data)
+
+    def test_variables(self):
+        data = {
+            "variables": {"a": "{{b}}", "b": "{{c}}"},
+            "contexts": {"main": []},
+        }
+        with pytest.raises(LinkError, match="undefined variable: c"):
+            SyntaxDefinition.load(data)
+
+        data["variables"]["c"] = "x{{a}}"
+        message = "cyclic variable: a -> b -> c -> a"
+        with pytest.raises(LinkError, match=message):
+            SyntaxDefinition.load(data)
+
+    def test_variables_memoized(self):
+        synfile = "Packages/YAML/YAML.sublime-syntax"
+        fullpath = Path(os.path.join(ASSETS_DIR, synfile))
+        data = yaml.load(fullpath.read_text(), yaml.FullLoader)
+        syndef = SyntaxDefinition.load(data)
+
+        # every variable is expanded once by `link`
+        assert set(syndef._expanded_variables) == set(syndef.variables)
+        c_tag_handle = r"(?:!(?:[0-9A-Za-z\-]*!)?)"
+        assert syndef._expanded_variables["c_tag_handle"] == c_tag_handle
+
+        # later expansions are served from the memo
+        syndef.variables["ns_word_char"] = "changed"
+        assert syndef.expand_variables("{{c_tag_handle}}") == c_tag_handle
+
+
+class TestLoadFile(object):
+    def test_load_file(self):
+        path = os.path.join(ASSETS_DIR, "Packages/JSON/JSON.sublime-syntax")
+        syndef = SyntaxDefinition.load_file(path)
+        assert syndef.scope == "source.json"
+
+        data = yaml.load(Path(path).read_text(), yaml.FullLoader)
+        assert SyntaxDefinition.load(data).digest == syndef.digest
+
+    def test_digest(self):
+        data = {"scope": "source.x", "contexts": {"main": [{"match": "a"}]}}
+        digest = SyntaxDefinition.load(data).digest
+        assert len(digest) == 40
+        assert SyntaxDefinition.load(data).digest == digest
+
+        data["contexts"]["main"][0]["scope"] = "keyword.x"
+        assert SyntaxDefinition.load(data).digest != digest